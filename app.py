@@ -1,8 +1,10 @@
 # Principal
 import streamlit as st
-import interpreter
 from dotenv import load_dotenv
-import threading
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 # st components
 from st_components.st_init import set_style
@@ -10,14 +12,9 @@ from st_components.st_session_states import init_session_states
 from st_components.st_sidebar import st_sidebar
 from st_components.st_main import st_main
 
-#validation
-from litellm import completion
-from openai import Model
-
 # lessons auto-update on startup (non-blocking)
-from src.data.database import create_tables, get_all_lessons
-from src.utils.lessons_miner import mine_default_datasets
-from src.utils.lessons_retriever import build_index
+from src.data.database import create_tables, get_all_lessons, get_lessons_version, get_meta
+from src.utils.lessons_updater import auto_update_lessons
 
 load_dotenv()  # Load environment variables from .env if present
 
@@ -28,22 +25,44 @@ st.title("💬 Grace")
 # Ensure DB tables exist
 create_tables()
 
-# Background auto-update of lessons if empty (runs once per session)
-def _auto_update_lessons_worker():
-    try:
-        # Mine a modest number to keep startup light
-        mine_default_datasets(limit_per_repo=60)
-        build_index()
-    except Exception:
-        # Never interrupt the app if background update fails
-        pass
+# Streamlit reruns this script on every interaction; keep lesson reads out of SQLite
+# unless the lessons table has changed (the version is part of the cache key)
+@st.cache_data(ttl=10)
+def _lessons_version():
+    return get_lessons_version()
+
+@st.cache_data(ttl=300)
+def _cached_get_all_lessons(limit, version):
+    return get_all_lessons(limit)
+
+# Background auto-update of lessons if empty. Guarded across all sessions/processes by
+# an OS file lock, and throttled to once a day via the meta table.
+LESSONS_LOCK_PATH = os.path.join("data", ".lessons_update.lock")
+LESSONS_UPDATE_INTERVAL = 24 * 60 * 60
+
+def _lessons_update_due():
+    # Back off on the last attempt, successful or not, so a failing crawl is not
+    # restarted by every new session
+    last = 0.0
+    for key in ('lessons_last_attempt_at', 'lessons_last_updated_at'):
+        try:
+            last = max(last, float(get_meta(key, 0) or 0))
+        except ValueError:
+            pass
+    return (time.time() - last) > LESSONS_UPDATE_INTERVAL
+
+@st.cache_resource
+def _get_miner_pool():
+    # One worker process for the whole server: mining/indexing is CPU-bound and would
+    # otherwise hold the GIL against the UI. "spawn" keeps this process's SQLite
+    # connections and Streamlit state out of the child.
+    return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
 
 if 'lessons_auto_update_started' not in st.session_state:
     try:
-        existing = get_all_lessons(limit=1)
-        if not existing:
-            t = threading.Thread(target=_auto_update_lessons_worker, daemon=True)
-            t.start()
+        existing = _cached_get_all_lessons(1, _lessons_version())
+        if not existing and _lessons_update_due():
+            _get_miner_pool().submit(auto_update_lessons, LESSONS_LOCK_PATH)
     finally:
         st.session_state['lessons_auto_update_started'] = True
 
@@ -8,12 +8,22 @@ Establishes foundation for schedule reviews with specification compliance checki
 Usage: python3 schedule_review_setup.py
 """
 
+import hashlib
 import os
+import pickle
 import sys
 from pathlib import Path
 from xerparser.reader import Reader
+import numpy as np
 import pandas as pd
 
+# Filename keywords used by detect_files
+NARRATIVE_KEYWORDS = ('narrative', 'network', 'analysis', 'monthly')
+SPEC_KEYWORDS = ('spec', 'specification', 'rfp', 'contract')
+
+# Parsed XER data is cached here, keyed by file path + mtime + size
+XER_CACHE_DIR = Path.home() / ".cache" / "grace"
+
 class ScheduleReviewSetup:
     def __init__(self):
         self.xer_file = None
@@ -42,30 +52,36 @@ class ScheduleReviewSetup:
         
         print("\n📁 DETECTING FILES...")
         
-        # Find XER files
-        xer_files = list(upload_dir.glob("*.xer"))
+        # One directory pass, classifying each entry against every file type
+        xer_files = []
+        narrative_files = []
+        spec_files = []
+        try:
+            with os.scandir(upload_dir) as it:
+                entries = [entry for entry in it if not entry.name.startswith('.')]
+        except OSError:
+            entries = []
+        for entry in entries:
+            name = entry.name
+            name_lower = name.lower()
+            if name.endswith('.xer'):
+                xer_files.append(entry.path)
+            # Narrative files: PDFs with "narrative", "network analysis", etc.
+            if name.endswith('.pdf') and any(keyword in name_lower for keyword in NARRATIVE_KEYWORDS):
+                narrative_files.append(entry.path)
+            if any(keyword in name_lower for keyword in SPEC_KEYWORDS):
+                spec_files.append(entry.path)
+        
         if xer_files:
-            self.xer_file = str(xer_files[0])
+            self.xer_file = xer_files[0]
             print(f"✅ XER File: {Path(self.xer_file).name}")
         
-        # Find narrative files (PDF with "narrative" or "network analysis")
-        narrative_files = []
-        for pdf_file in upload_dir.glob("*.pdf"):
-            if any(keyword in pdf_file.name.lower() for keyword in ['narrative', 'network', 'analysis', 'monthly']):
-                narrative_files.append(pdf_file)
-        
         if narrative_files:
-            self.narrative_file = str(narrative_files[0])
+            self.narrative_file = narrative_files[0]
             print(f"✅ Narrative: {Path(self.narrative_file).name}")
         
-        # Find specification files
-        spec_files = []
-        for file in upload_dir.glob("*"):
-            if any(keyword in file.name.lower() for keyword in ['spec', 'specification', 'rfp', 'contract']):
-                spec_files.append(file)
-        
         if spec_files:
-            self.spec_file = str(spec_files[0])
+            self.spec_file = spec_files[0]
             print(f"✅ Specification: {Path(self.spec_file).name}")
         
         # Manual file selection if needed
@@ -103,10 +119,53 @@ class ScheduleReviewSetup:
                 return False
         return True
     
+    def _xer_cache_path(self, kind):
+        """Cache file for this XER file's current contents (changes with mtime/size)"""
+        stat = os.stat(self.xer_file)
+        key = hashlib.sha1(
+            f"{os.path.abspath(self.xer_file)}:{stat.st_mtime}:{stat.st_size}".encode()
+        ).hexdigest()
+        return XER_CACHE_DIR / f"{kind}_{key}.pkl"
+
+    def _load_cached(self, kind):
+        try:
+            with open(self._xer_cache_path(kind), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def _store_cached(self, kind, value):
+        try:
+            path = self._xer_cache_path(kind)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            # Caching is best effort (e.g. unpicklable parser objects, read-only home)
+            pass
+
+    def _print_parse_summary(self):
+        print(f"✅ Successfully parsed XER file:")
+        print(f"   • Project: {self.project_info.get('name', 'Unknown')}")
+        print(f"   • Activities: {self.schedule_data['activity_count']:,}")
+        print(f"   • Relationships: {self.schedule_data['relationship_count']:,}")
+        print(f"   • Resources: {self.schedule_data['resource_count']:,}")
+        print(f"   • WBS Elements: {self.schedule_data['wbs_count']:,}")
+
     def parse_xer_file(self):
-        """Parse XER file using PyP6XER"""
+        """Parse XER file using PyP6XER (cached on disk until the file changes)"""
         print(f"\n⚙️  PARSING XER FILE: {Path(self.xer_file).name}")
         
+        cached = self._load_cached('xer')
+        if cached is not None:
+            self.project_info, self.schedule_data = cached
+            # The reader handle is not cached; it is only needed while parsing
+            self.schedule_data['reader'] = None
+            self._print_parse_summary()
+            return True
+        
         try:
             reader = Reader(self.xer_file)
             
@@ -139,12 +198,10 @@ class ScheduleReviewSetup:
                 'wbs_count': len(wbs_elements)
             }
             
-            print(f"✅ Successfully parsed XER file:")
-            print(f"   • Project: {self.project_info['name']}")
-            print(f"   • Activities: {len(activities):,}")
-            print(f"   • Relationships: {len(relationships):,}")
-            print(f"   • Resources: {len(resources):,}")
-            print(f"   • WBS Elements: {len(wbs_elements):,}")
+            self._print_parse_summary()
+            
+            serializable = {k: v for k, v in self.schedule_data.items() if k != 'reader'}
+            self._store_cached('xer', (self.project_info, serializable))
             
             return True
             
@@ -156,14 +213,21 @@ class ScheduleReviewSetup:
         """Quick lag analysis"""
         print(f"\n🔗 ANALYZING RELATIONSHIP LAGS...")
         
-        relationships_with_lags = []
-        lag_summary = {}
-        
-        for rel in self.schedule_data['relationships']:
-            if hasattr(rel, 'lag_hr_cnt') and rel.lag_hr_cnt and rel.lag_hr_cnt != 0:
-                relationships_with_lags.append(rel)
-                lag_days = rel.lag_hr_cnt / 8
-                lag_summary[lag_days] = lag_summary.get(lag_days, 0) + 1
+        cached = self._load_cached('xer_lags')
+        if cached is not None:
+            relationships_with_lags, lag_summary = cached
+        else:
+            relationships = self.schedule_data['relationships']
+            lags = np.fromiter(
+                (getattr(rel, 'lag_hr_cnt', 0) or 0 for rel in relationships),
+                dtype=np.float64, count=len(relationships)
+            )
+            has_lag = lags != 0
+            relationships_with_lags = [relationships[i] for i in np.flatnonzero(has_lag)]
+            lag_days, counts = np.unique(lags[has_lag] / 8, return_counts=True)
+            lag_summary = dict(zip(lag_days.tolist(), counts.tolist()))
+            
+            self._store_cached('xer_lags', (relationships_with_lags, lag_summary))
         
         print(f"✅ Lag Analysis Complete:")
         print(f"   • Relationships with lags: {len(relationships_with_lags)}")
@@ -1,23 +1,80 @@
 import sqlite3
-import uuid
+import threading
 from contextlib import contextmanager
-from src.data.models import Conversation, Chat
+from src.data.models import Conversation
 
 DATABASE_PATH = "chats.db"
 
+# One connection per thread: Streamlit's script thread and the background
+# lessons worker each get their own handle, so nothing is shared across threads.
+_local = threading.local()
+
+
+def _get_connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        # isolation_level=None -> autocommit; multi-statement writes use explicit BEGIN/COMMIT
+        connection = sqlite3.connect(DATABASE_PATH, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA temp_store=MEMORY")
+        connection.execute("PRAGMA cache_size=-20000")
+        # INSERT OR REPLACE only fires the DELETE trigger that keeps lessons_fts in sync with this on
+        connection.execute("PRAGMA recursive_triggers=ON")
+        # Rows support both index and name access, so callers can dict() them directly
+        connection.row_factory = sqlite3.Row
+        _local.connection = connection
+    return connection
+
+
+def close_connection():
+    """Close the calling thread's cached connection, if any."""
+    connection = getattr(_local, 'connection', None)
+    if connection is not None:
+        _local.connection = None
+        connection.close()
+
+
 @contextmanager
 def create_connection():
-    connection = sqlite3.connect(DATABASE_PATH)
-    cursor = connection.cursor()
-
+    cursor = _get_connection().cursor()
     try:
         yield cursor
     finally:
-        connection.commit()
-        connection.close()
+        cursor.close()
+
+
+@contextmanager
+def _write_transaction():
+    with create_connection() as cursor:
+        cursor.execute("BEGIN")
+        try:
+            yield cursor
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+
+CHATS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+        conversation_id TEXT,
+        role TEXT,
+        content TEXT,
+        FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+    )
+'''
+
+# Bump when create_tables gains a new table/column/index so existing databases re-run it
+SCHEMA_VERSION = 1
 
 def create_tables():
     with create_connection() as cursor:
+        # Schema already current: startup is a single PRAGMA read
+        cursor.execute("PRAGMA user_version")
+        if cursor.fetchone()[0] >= SCHEMA_VERSION:
+            return
+
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS conversations (
                 id TEXT PRIMARY KEY,
@@ -26,15 +83,17 @@ def create_tables():
             )
         ''')
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chats (
-                id TEXT PRIMARY KEY,
-                conversation_id TEXT,
-                role TEXT,
-                content TEXT,
-                FOREIGN KEY (conversation_id) REFERENCES conversations(id)
-            )
-        ''')
+        cursor.execute(CHATS_TABLE_SQL.format(name='chats'))
+
+        # Migrate: older databases generate chats.id in Python; rebuild with the SQL default
+        cursor.execute("PRAGMA table_info(chats)")
+        if any(row[1] == 'id' and row[4] is None for row in cursor.fetchall()):
+            cursor.execute("BEGIN")
+            cursor.execute(CHATS_TABLE_SQL.format(name='chats_new'))
+            cursor.execute("INSERT INTO chats_new (id, conversation_id, role, content) SELECT id, conversation_id, role, content FROM chats ORDER BY rowid")
+            cursor.execute("DROP TABLE chats")
+            cursor.execute("ALTER TABLE chats_new RENAME TO chats")
+            cursor.execute("COMMIT")
 
         # Lessons table for commit-learning (stores mined bug/fix pairs)
         cursor.execute('''
@@ -72,98 +131,203 @@ def create_tables():
             if col not in existing_cols:
                 cursor.execute(f"ALTER TABLE lessons ADD COLUMN {col} {col_type}")
 
+        # Small key/value store for app bookkeeping (e.g. last lessons auto-update)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+        # Indexes for the recent-lessons listing and per-conversation chat lookups/deletes
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_lessons_created_at'")
+        needs_analyze = cursor.fetchone() is None
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lessons_created_at ON lessons(created_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chats_conversation_id ON chats(conversation_id)")
+        if needs_analyze:
+            # Refresh planner statistics once so the new indexes get picked
+            cursor.execute("ANALYZE")
+
+        # Full-text index over lessons, kept in sync by triggers
+        try:
+            _create_lessons_fts(cursor)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; find_lessons_by_text falls back to LIKE
+            pass
+
+        cursor.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+def _create_lessons_fts(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='lessons_fts'")
+    is_new = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS lessons_fts USING fts5(
+            commit_message, before_code, after_code, tags,
+            content='lessons', content_rowid='rowid', tokenize='porter unicode61'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_ai AFTER INSERT ON lessons BEGIN
+            INSERT INTO lessons_fts(rowid, commit_message, before_code, after_code, tags)
+            VALUES (new.rowid, new.commit_message, new.before_code, new.after_code, new.tags);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_ad AFTER DELETE ON lessons BEGIN
+            INSERT INTO lessons_fts(lessons_fts, rowid, commit_message, before_code, after_code, tags)
+            VALUES ('delete', old.rowid, old.commit_message, old.before_code, old.after_code, old.tags);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS lessons_fts_au AFTER UPDATE ON lessons BEGIN
+            INSERT INTO lessons_fts(lessons_fts, rowid, commit_message, before_code, after_code, tags)
+            VALUES ('delete', old.rowid, old.commit_message, old.before_code, old.after_code, old.tags);
+            INSERT INTO lessons_fts(rowid, commit_message, before_code, after_code, tags)
+            VALUES (new.rowid, new.commit_message, new.before_code, new.after_code, new.tags);
+        END
+    ''')
+    if is_new:
+        # Index any lessons stored before the FTS table existed
+        cursor.execute("INSERT INTO lessons_fts(lessons_fts) VALUES ('rebuild')")
+
+# Hot-path statements are module constants so the per-thread connection's statement
+# cache (sqlite3 keeps the last 128 prepared statements) keeps hitting on them.
+_LESSON_COLUMNS = "id, repo, file_path, branch, commit_sha, commit_message, before_code, after_code, tags, language, framework, change_type, lines_changed, tokens_changed"
+
+SQL_SAVE_CONVERSATION = "INSERT INTO conversations (id, user_id, name) VALUES (?, ?, ?)"
+SQL_SAVE_CHAT = "INSERT INTO chats (conversation_id, role, content) VALUES (?, ?, ?)"
+SQL_GET_ALL_CONVERSATIONS = "SELECT id, user_id, name FROM conversations WHERE user_id=?"
+SQL_GET_CONVERSATION = "SELECT id, name FROM conversations WHERE id=?"
+SQL_GET_CHATS = "SELECT conversation_id, role, content FROM chats WHERE conversation_id=?"
+SQL_DELETE_CHATS = "DELETE FROM chats WHERE conversation_id=?"
+SQL_DELETE_CONVERSATION = "DELETE FROM conversations WHERE id=?"
+SQL_SAVE_LESSON = f"INSERT OR REPLACE INTO lessons ({_LESSON_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_GET_ALL_LESSONS = f"SELECT {_LESSON_COLUMNS} FROM lessons ORDER BY created_at DESC LIMIT ?"
+SQL_FIND_LESSONS_FTS = (
+    "SELECT l.id, l.repo, l.file_path, l.branch, l.commit_sha, l.commit_message, l.before_code, l.after_code, "
+    "l.tags, l.language, l.framework, l.change_type, l.lines_changed, l.tokens_changed "
+    "FROM lessons l JOIN lessons_fts f ON f.rowid = l.rowid "
+    "WHERE lessons_fts MATCH ? ORDER BY bm25(lessons_fts) LIMIT ?"
+)
+SQL_FIND_LESSONS_LIKE = (
+    f"SELECT {_LESSON_COLUMNS} FROM lessons "
+    "WHERE commit_message LIKE ? OR before_code LIKE ? OR after_code LIKE ? OR tags LIKE ? "
+    "ORDER BY created_at DESC LIMIT ?"
+)
+SQL_GET_LESSONS_BY_IDS = f"SELECT {_LESSON_COLUMNS} FROM lessons WHERE id IN ({{placeholders}})"
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER (999 on older builds)
+LESSON_IDS_PER_QUERY = 500
+SQL_LESSONS_VERSION = "SELECT COALESCE(MAX(rowid), 0) FROM lessons"
+SQL_GET_META = "SELECT value FROM meta WHERE key=?"
+SQL_SET_META = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+
 def save_conversation(conversation):
-    with create_connection() as cursor:
-        cursor.execute("INSERT INTO conversations (id, user_id, name) VALUES (?, ?, ?)", (conversation.id, conversation.user_id, conversation.name))
+    with _write_transaction() as cursor:
+        cursor.execute(SQL_SAVE_CONVERSATION, (conversation.id, conversation.user_id, conversation.name))
 
 def save_chat(chat):
-    with create_connection() as cursor:
-        cursor.execute("INSERT INTO chats (id, conversation_id, role, content) VALUES (?, ?, ?, ?)", (str(uuid.uuid4()), chat.conversation_id, chat.role, chat.content))
+    with _write_transaction() as cursor:
+        cursor.execute(SQL_SAVE_CHAT, (chat.conversation_id, chat.role, chat.content))
 
 def get_all_conversations(user_id):
-    with create_connection() as cursor:
-        cursor.execute("SELECT id, user_id, name FROM conversations WHERE user_id=?", (user_id,))
-        result = cursor.fetchall()
-        conversations = [Conversation(*row) for row in result]
-        return [conversation.to_dict() for conversation in conversations]
+    return [dict(row) for row in _get_connection().execute(SQL_GET_ALL_CONVERSATIONS, (user_id,))]
 
 def get_conversation_by_id(conversation_id):
-    with create_connection() as cursor:
-        cursor.execute("SELECT id, name FROM conversations WHERE id=?", (conversation_id,))
-        result = cursor.fetchone()
-        return Conversation(*result) if result else None
+    result = _get_connection().execute(SQL_GET_CONVERSATION, (conversation_id,)).fetchone()
+    return Conversation(*result) if result else None
 
 def get_chats_by_conversation_id(conversation_id):
-    with create_connection() as cursor:
-        cursor.execute("SELECT conversation_id, role, content FROM chats WHERE conversation_id=?", (conversation_id,))
-        result = cursor.fetchall()
-        chats = [Chat(conversation_id, *row[1:]) for row in result]
-        return [chat.to_dict() for chat in chats]
+    return [dict(row) for row in _get_connection().execute(SQL_GET_CHATS, (conversation_id,))]
 
 def delete_conversation(conversation_id):
-    with create_connection() as cursor:
-        cursor.execute("DELETE FROM chats WHERE conversation_id=?", (conversation_id,))
-        cursor.execute("DELETE FROM conversations WHERE id=?", (conversation_id,))
+    with _write_transaction() as cursor:
+        cursor.execute(SQL_DELETE_CHATS, (conversation_id,))
+        cursor.execute(SQL_DELETE_CONVERSATION, (conversation_id,))
 
 # ----- Lessons CRUD -----
+def _as_int(value):
+    return value if type(value) is int else int(value or 0)
+
+def save_lessons_bulk(lessons):
+    """Save many lesson dicts (same keys as save_lesson) in a single transaction. Returns rows written."""
+    rows = [
+        (
+            lesson.get('id'),
+            lesson.get('repo'),
+            lesson.get('file_path'),
+            lesson.get('branch'),
+            lesson.get('commit_sha'),
+            lesson.get('commit_message'),
+            lesson.get('before_code'),
+            lesson.get('after_code'),
+            lesson.get('tags', ''),
+            lesson.get('language'),
+            lesson.get('framework'),
+            lesson.get('change_type'),
+            _as_int(lesson.get('lines_changed')),
+            _as_int(lesson.get('tokens_changed')),
+        )
+        for lesson in lessons
+    ]
+    if not rows:
+        return 0
+    with _write_transaction() as cursor:
+        cursor.executemany(SQL_SAVE_LESSON, rows)
+    return len(rows)
+
 def save_lesson(lesson):
     """Save a lesson dict with keys: id, repo, file_path, branch, commit_sha, commit_message, before_code, after_code, tags, language, framework, change_type, lines_changed, tokens_changed"""
+    save_lessons_bulk([lesson])
+
+def iter_lessons(limit=200, chunk=256):
+    """Yield the most recent lessons as dicts, fetching `chunk` rows at a time.
+
+    Callers that only need the first few lessons can stop iterating early.
+    """
     with create_connection() as cursor:
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO lessons (id, repo, file_path, branch, commit_sha, commit_message, before_code, after_code, tags, language, framework, change_type, lines_changed, tokens_changed)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                lesson.get('id'),
-                lesson.get('repo'),
-                lesson.get('file_path'),
-                lesson.get('branch'),
-                lesson.get('commit_sha'),
-                lesson.get('commit_message'),
-                lesson.get('before_code'),
-                lesson.get('after_code'),
-                lesson.get('tags', ''),
-                lesson.get('language'),
-                lesson.get('framework'),
-                lesson.get('change_type'),
-                int(lesson.get('lines_changed') or 0),
-                int(lesson.get('tokens_changed') or 0),
-            )
-        )
+        cursor.arraysize = chunk
+        cursor.execute(SQL_GET_ALL_LESSONS, (limit,))
+        while rows := cursor.fetchmany(chunk):
+            yield from (dict(r) for r in rows)
 
 def get_all_lessons(limit=200):
-    with create_connection() as cursor:
-        cursor.execute("SELECT id, repo, file_path, branch, commit_sha, commit_message, before_code, after_code, tags, language, framework, change_type, lines_changed, tokens_changed FROM lessons ORDER BY created_at DESC LIMIT ?", (limit,))
-        rows = cursor.fetchall()
-        lessons = []
-        for r in rows:
-            lessons.append({
-                'id': r[0], 'repo': r[1], 'file_path': r[2], 'branch': r[3], 'commit_sha': r[4],
-                'commit_message': r[5], 'before_code': r[6], 'after_code': r[7], 'tags': r[8],
-                'language': r[9], 'framework': r[10], 'change_type': r[11], 'lines_changed': r[12], 'tokens_changed': r[13]
-            })
-        return lessons
+    return list(iter_lessons(limit))
+
+def get_lessons_by_ids(ids):
+    """Fetch the lessons with the given ids as dicts (unknown ids are skipped; order is not preserved)."""
+    ids = list(ids)
+    connection = _get_connection()
+    lessons = []
+    for start in range(0, len(ids), LESSON_IDS_PER_QUERY):
+        batch = ids[start:start + LESSON_IDS_PER_QUERY]
+        sql = SQL_GET_LESSONS_BY_IDS.format(placeholders=",".join("?" * len(batch)))
+        lessons.extend(dict(r) for r in connection.execute(sql, batch))
+    return lessons
 
 def find_lessons_by_text(query, limit=5):
-    """Very simple LIKE-based search as a fallback; more advanced retrieval in utils.lessons."""
+    """Full-text search (FTS5, bm25-ranked) with a LIKE fallback; more advanced retrieval in utils.lessons."""
+    # Quote as a single FTS5 phrase so user text is never parsed as query syntax
+    phrase = '"' + (query or '').replace('"', '""') + '"'
+    connection = _get_connection()
+    # A blank phrase matches nothing in FTS5; the LIKE scan returns the latest lessons for it
+    if (query or '').strip():
+        try:
+            return [dict(r) for r in connection.execute(SQL_FIND_LESSONS_FTS, (phrase, limit))]
+        except sqlite3.OperationalError:
+            # FTS table missing (e.g. SQLite without FTS5); fall back to the LIKE scan
+            pass
     like = f"%{query}%"
-    with create_connection() as cursor:
-        cursor.execute(
-            """
-            SELECT id, repo, file_path, branch, commit_sha, commit_message, before_code, after_code, tags, language, framework, change_type, lines_changed, tokens_changed
-            FROM lessons
-            WHERE commit_message LIKE ? OR before_code LIKE ? OR after_code LIKE ? OR tags LIKE ?
-            ORDER BY created_at DESC LIMIT ?
-            """,
-            (like, like, like, like, limit)
-        )
-        rows = cursor.fetchall()
-        lessons = []
-        for r in rows:
-            lessons.append({
-                'id': r[0], 'repo': r[1], 'file_path': r[2], 'branch': r[3], 'commit_sha': r[4],
-                'commit_message': r[5], 'before_code': r[6], 'after_code': r[7], 'tags': r[8],
-                'language': r[9], 'framework': r[10], 'change_type': r[11], 'lines_changed': r[12], 'tokens_changed': r[13]
-            })
-        return lessons
\ No newline at end of file
+    return [dict(r) for r in connection.execute(SQL_FIND_LESSONS_LIKE, (like, like, like, like, limit))]
+
+def get_lessons_version():
+    """Cheap change marker for the lessons table: grows whenever lessons are written."""
+    return _get_connection().execute(SQL_LESSONS_VERSION).fetchone()[0]
+
+# ----- Meta -----
+def get_meta(key, default=None):
+    row = _get_connection().execute(SQL_GET_META, (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(key, value):
+    with _write_transaction() as cursor:
+        cursor.execute(SQL_SET_META, (key, str(value)))
@@ -1,15 +1,24 @@
+import importlib.util
 import os
 import subprocess
 import sys
+from functools import lru_cache
 
 
+@lru_cache(maxsize=None)
 def ensure_package(pip_name: str) -> bool:
-    """Install a pip package at runtime if allowed. Returns True if available/installed."""
+    """Install a pip package at runtime if allowed. Returns True if available/installed.
+
+    Results are cached for the life of the process: a failed install stays False
+    until restart instead of re-running pip on every call.
+    """
     if not pip_name:
         return False
+    # find_spec only locates the module; unlike __import__ it does not execute it
+    mod = pip_name.split("[", 1)[0].replace('-', '_')
     try:
-        __import__(pip_name.split("[", 1)[0].replace('-', '_'))
-        return True
+        if importlib.util.find_spec(mod) is not None:
+            return True
     except Exception:
         pass
 
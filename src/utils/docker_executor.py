@@ -1,32 +1,70 @@
+import atexit
+import codecs
 import tempfile
 import os
-import uuid
+import threading
+import time
+from typing import Iterator
 try:
     import docker  # type: ignore
 except Exception:  # Docker SDK not installed
     docker = None
 
+# Run as the sandbox user after every snippet: kill whatever it left running (kill -1
+# spares PID 1, the container's sleep, and the calling shell) and empty the writable
+# mounts, so the next run starts from the same state as a fresh container
+_WIPE_SCRIPT = "kill -KILL -1 2>/dev/null; find /home/sandbox /tmp /dev/shm -mindepth 1 -delete"
+
+
 class DockerCodeExecutor:
+    # Seconds to trust the last daemon ping before probing again
+    AVAILABILITY_TTL = 60.0
+    # Wall-clock seconds a snippet may run before it is killed
+    EXEC_TIMEOUT = 30
+    # Wiped containers kept warm between runs; every run has a container to itself
+    IDLE_CONTAINERS = 2
+
     def __init__(self):
         self.client = None
         self.image_name = "oi-code-sandbox"
+        self._image_ready = False
+        self._available = False
+        self._available_checked_at = 0.0
+        self._idle_containers = []
+        self._live_containers = set()
+        self._cleanup_registered = False
+        # The executor is shared by all sessions, which check containers in and out concurrently
+        self._containers_lock = threading.Lock()
 
     def is_available(self) -> bool:
-        """Return True if Docker SDK and daemon are reachable."""
+        """Return True if Docker SDK and daemon are reachable (cached for AVAILABILITY_TTL seconds)."""
         if docker is None:
             return False
+        now = time.monotonic()
+        if self._available_checked_at and (now - self._available_checked_at) < self.AVAILABILITY_TTL:
+            return self._available
         try:
             if self.client is None:
                 self.client = docker.from_env()
             # ping server
             self.client.ping()
-            return True
+            self._available = True
         except Exception:
             self.client = None
-            return False
+            self._available = False
+            self._image_ready = False
+        self._available_checked_at = now
+        return self._available
+
+    def refresh_availability(self) -> bool:
+        """Forget the cached daemon ping and check again"""
+        self._available_checked_at = 0.0
+        return self.is_available()
 
     def _build_sandbox_image(self):
         """Build the sandbox Docker image if it doesn't exist"""
+        if self._image_ready:
+            return
         if not self.is_available():
             raise RuntimeError("Docker is not available")
         try:
@@ -59,44 +97,145 @@ ENV PYTHONPATH=/home/sandbox
                     tag=self.image_name,
                     rm=True
                 )
+        self._image_ready = True
+
+    def _new_container(self):
+        """Start a sleeping sandbox container that snippets are exec'd into."""
+        container = self.client.containers.run(
+            self.image_name,
+            command="sleep infinity",
+            working_dir='/home/sandbox',
+            detach=True,
+            remove=True,
+            mem_limit='128m',  # Memory limit
+            cpu_quota=50000,  # CPU limit (50% of one core)
+            read_only=True,  # Read-only filesystem
+            network_disabled=True,  # No network access
+            # Writable scratch space on top of the read-only root
+            tmpfs={'/home/sandbox': 'rw,size=64m,mode=1777', '/tmp': 'rw,size=64m,mode=1777'},
+        )
+        with self._containers_lock:
+            self._live_containers.add(container)
+            if not self._cleanup_registered:
+                atexit.register(self.cleanup)
+                self._cleanup_registered = True
+        return container
+
+    def _acquire_container(self):
+        """A container for one run: a wiped idle one if there is one, else a new one."""
+        with self._containers_lock:
+            if self._idle_containers:
+                return self._idle_containers.pop()
+        return self._new_container()
+
+    def _release_container(self, container):
+        """Wipe what the run left behind, then keep the container warm or remove it."""
+        try:
+            clean = container.exec_run(["sh", "-c", _WIPE_SCRIPT], user='sandbox').exit_code == 0
+        except Exception:
+            clean = False
+        if clean:
+            with self._containers_lock:
+                if len(self._idle_containers) < self.IDLE_CONTAINERS:
+                    self._idle_containers.append(container)
+                    return
+        self._remove_container(container)
+
+    def _remove_container(self, container):
+        with self._containers_lock:
+            self._live_containers.discard(container)
+        try:
+            container.remove(force=True)
+        except Exception:
+            pass
+
+    def cleanup(self):
+        """Stop and remove the sandbox containers."""
+        with self._containers_lock:
+            containers = list(self._live_containers)
+            self._idle_containers = []
+        for container in containers:
+            self._remove_container(container)
+
+    def _start_exec(self, container, code: str, language: str):
+        """Start the snippet in container under a wall-clock limit; returns (exec_id, output stream)."""
+        cmd = ["python", "-u", "-c", code] if language == "python" else ["node", "-e", code]
+        cmd = ["timeout", "-s", "KILL", str(self.EXEC_TIMEOUT)] + cmd
+        exec_id = self.client.api.exec_create(container.id, cmd, workdir='/home/sandbox', user='sandbox')['Id']
+        return exec_id, self.client.api.exec_start(exec_id, stream=True)
+
+    def _run(self, code: str, language: str):
+        """Check out a container and start the snippet in it; returns (container, exec_id, output stream).
+
+        Retries once on a fresh container if an idle one has gone away.
+        """
+        for attempt in range(2):
+            container = self._acquire_container()
+            try:
+                return (container,) + self._start_exec(container, code, language)
+            except Exception:
+                self._remove_container(container)
+                if attempt:
+                    raise
+
+    def _watchdog(self, container) -> threading.Timer:
+        # timeout only kills the snippet itself; children it left holding the output
+        # stream open are killed by wiping the container a little after the deadline
+        def kill_all():
+            try:
+                container.exec_run(["sh", "-c", "kill -KILL -1"], user='sandbox')
+            except Exception:
+                pass
+
+        timer = threading.Timer(self.EXEC_TIMEOUT + 5, kill_all)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def execute_code_stream(self, code: str, language: str = "python") -> Iterator[str]:
+        """Execute code in a Docker container, yielding output as it is produced.
+
+        Raises RuntimeError (on first iteration) if Docker is not available.
+        """
+        if not self.is_available():
+            raise RuntimeError("Docker not available")
+        self._build_sandbox_image()
+
+        container, exec_id, chunks = self._run(code, language)
+        watchdog = self._watchdog(container)
+        try:
+            decoder = codecs.getincrementaldecoder('utf-8')('replace')
+            for chunk in chunks:
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield text
+            exit_code = self.client.api.exec_inspect(exec_id).get('ExitCode')
+            if exit_code:
+                yield f"\nExit code: {exit_code}"
+        finally:
+            watchdog.cancel()
+            self._release_container(container)
 
     def execute_code(self, code: str, language: str = "python") -> str:
         """Execute code in a Docker container"""
         if not self.is_available():
             return "Docker not available"
         self._build_sandbox_image()
-
-        # Create temporary file for code (use .py for python)
-        ext = '.py' if language == 'python' else f'.{language}'
-        with tempfile.NamedTemporaryFile(mode='w', suffix=ext, delete=False) as code_file:
-            code_file.write(code)
-            code_file_path = code_file.name
-
         try:
-            # Run code in container
-            container = self.client.containers.run(
-                self.image_name,
-                command=f"python {os.path.basename(code_file_path)}" if language == "python" else f"node {os.path.basename(code_file_path)}",
-                volumes={code_file_path: {'bind': f'/home/sandbox/{os.path.basename(code_file_path)}', 'mode': 'ro'}},
-                working_dir='/home/sandbox',
-                detach=False,
-                stdout=True,
-                stderr=True,
-                remove=True,
-                mem_limit='128m',  # Memory limit
-                cpu_quota=50000,  # CPU limit (50% of one core)
-                read_only=True,  # Read-only filesystem
-                network_disabled=True  # No network access
-            )
-
-            return container.decode('utf-8')
+            container, exec_id, chunks = self._run(code, language)
         except Exception as e:
-            # Includes docker.errors.ContainerError and others
-            try:
-                # Some errors provide stderr
-                return f"Error: {e.stderr.decode('utf-8')}"
-            except Exception:
-                return f"Execution failed: {str(e)}"
+            return f"Execution failed: {str(e)}"
+        watchdog = self._watchdog(container)
+        try:
+            text = b"".join(chunks).decode('utf-8', 'replace')
+            if self.client.api.exec_inspect(exec_id).get('ExitCode'):
+                return f"Error: {text}"
+            return text
+        except Exception as e:
+            return f"Execution failed: {str(e)}"
         finally:
-            # Clean up temporary file
-            os.unlink(code_file_path)
+            watchdog.cancel()
+            self._release_container(container)
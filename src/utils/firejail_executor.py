@@ -1,7 +1,27 @@
 import subprocess
-import tempfile
-import os
-import shlex
+import shutil
+
+# Restrictions applied to every sandboxed run
+_FIREJAIL_BASE_ARGS = (
+    '--noprofile',  # Start with minimal profile
+    '--private',    # Private filesystem
+    '--private-dev', # Private /dev
+    '--private-etc', # Private /etc
+    '--noexec=/tmp', # No execution in /tmp
+    '--noexec=/var', # No execution in /var
+    '--noexec=/home', # No execution in /home (except allowed)
+    '--read-only=/', # Read-only root filesystem
+    '--whitelist=/usr',  # Allow /usr
+    '--whitelist=/lib',  # Allow /lib
+    '--whitelist=/lib64', # Allow /lib64
+    '--whitelist=/bin',  # Allow /bin
+    '--whitelist=/sbin', # Allow /sbin
+    '--tmpfs=/tmp',    # Temporary filesystem for /tmp
+    '--net=none',      # No network access
+    '--memory-limit=128m',  # Memory limit
+    '--cpu=1',         # CPU limit
+)
+
 
 class FirejailCodeExecutor:
     def __init__(self):
@@ -9,13 +29,7 @@ class FirejailCodeExecutor:
 
     def _find_firejail(self):
         """Find firejail executable"""
-        try:
-            result = subprocess.run(['which', 'firejail'], capture_output=True, text=True)
-            if result.returncode == 0:
-                return result.stdout.strip()
-        except:
-            pass
-        return None
+        return shutil.which('firejail')
 
     def is_available(self):
         """Check if firejail is available"""
@@ -26,45 +40,20 @@ class FirejailCodeExecutor:
         if not self.is_available():
             raise Exception("Firejail is not installed or not found in PATH")
 
-        # Create temporary file for code
-        with tempfile.NamedTemporaryFile(mode='w', suffix=f'.{language}', delete=False) as code_file:
-            code_file.write(code)
-            code_file_path = code_file.name
+        # Code is piped over stdin, so no temp file has to be visible inside the jail
+        if language == "python":
+            runner = ('python3', '-')
+        elif language == "bash" or language == "sh":
+            runner = ('bash', '-s')
+        else:
+            runner = (language, '-')
+        cmd = (self.firejail_path,) + _FIREJAIL_BASE_ARGS + runner
 
         try:
-            # Build firejail command with restrictions
-            cmd = [
-                self.firejail_path,
-                '--noprofile',  # Start with minimal profile
-                '--private',    # Private filesystem
-                '--private-dev', # Private /dev
-                '--private-etc', # Private /etc
-                '--noexec=/tmp', # No execution in /tmp
-                '--noexec=/var', # No execution in /var
-                '--noexec=/home', # No execution in /home (except allowed)
-                '--read-only=/', # Read-only root filesystem
-                '--whitelist=/usr',  # Allow /usr
-                '--whitelist=/lib',  # Allow /lib
-                '--whitelist=/lib64', # Allow /lib64
-                '--whitelist=/bin',  # Allow /bin
-                '--whitelist=/sbin', # Allow /sbin
-                '--tmpfs=/tmp',    # Temporary filesystem for /tmp
-                '--net=none',      # No network access
-                '--memory-limit=128m',  # Memory limit
-                '--cpu=1',         # CPU limit
-            ]
-
-            # Add language-specific execution
-            if language == "python":
-                cmd.extend(['python3', code_file_path])
-            elif language == "bash" or language == "sh":
-                cmd.extend(['bash', code_file_path])
-            else:
-                cmd.extend([language, code_file_path])
-
             # Run the command
             result = subprocess.run(
                 cmd,
+                input=code,
                 capture_output=True,
                 text=True,
                 timeout=30  # 30 second timeout
@@ -84,9 +73,3 @@ class FirejailCodeExecutor:
             return "Execution timed out after 30 seconds"
         except Exception as e:
             return f"Firejail execution failed: {str(e)}"
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(code_file_path)
-            except:
-                pass
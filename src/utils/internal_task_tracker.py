@@ -3,18 +3,62 @@ Internal Task Tracker for OpenInterpreter
 Manages multi-step tasks internally without user-facing output
 """
 import json
+import re
 import uuid
+from collections import deque
 from typing import List, Dict, Optional
 from datetime import datetime
 import streamlit as st
 
+# Keyword detection is compiled once and scans each message in a single pass.
+# Plain substring alternations keep the previous `keyword in message.lower()` semantics.
+_MULTISTEP_RE = re.compile(
+    r"create|build|develop|implement|design|analyze|review|process|generate|setup|"
+    r"configure|install|deploy|test|debug|multiple|several|various|different|"
+    r"step by step|phases|stages|milestones",
+    re.IGNORECASE,
+)
+_URGENT_RE = re.compile(r"urgent|asap|critical|important", re.IGNORECASE)
+
+# Common task patterns and their subtasks; the first matching pattern wins
+_PATTERN_SUBTASKS = [
+    (re.compile(r"create|build", re.IGNORECASE), [
+        "Analyze requirements",
+        "Design solution",
+        "Implement core functionality",
+        "Test and validate",
+        "Finalize and deliver",
+    ]),
+    (re.compile(r"analyze|review", re.IGNORECASE), [
+        "Gather and examine data",
+        "Identify key patterns",
+        "Generate insights",
+        "Provide recommendations",
+    ]),
+    (re.compile(r"setup|configure", re.IGNORECASE), [
+        "Check prerequisites",
+        "Install dependencies",
+        "Configure settings",
+        "Verify setup",
+    ]),
+    (re.compile(r"debug|fix", re.IGNORECASE), [
+        "Reproduce issue",
+        "Identify root cause",
+        "Implement solution",
+        "Test fix",
+    ]),
+]
+
+def _now_iso() -> str:
+    return datetime.now().isoformat()
+
 class InternalTask:
     def __init__(self, task_id: str, description: str, priority: str = "medium"):
         self.id = task_id
         self.description = description
         self.status = "pending"  # pending, in_progress, completed, failed
         self.priority = priority  # low, medium, high
-        self.created_at = datetime.now().isoformat()
+        self.created_at = _now_iso()
         self.updated_at = self.created_at
         self.subtasks = []
         self.context = {}
@@ -41,6 +85,9 @@ class InternalTask:
         task.context = data.get('context', {})
         return task
 
+# Completed tasks kept in history; older entries fall off automatically
+MAX_TASK_HISTORY = 50
+
 class InternalTaskTracker:
     def __init__(self):
         self.session_key = "_internal_task_tracker"
@@ -55,21 +102,17 @@ class InternalTaskTracker:
             st.session_state[self.session_key] = {
                 'tasks': {},
                 'active_task_id': None,
-                'task_history': []
+                'task_history': deque(maxlen=MAX_TASK_HISTORY)
             }
+        else:
+            state = st.session_state[self.session_key]
+            if not isinstance(state['task_history'], deque):
+                # Session created before history became a bounded deque
+                state['task_history'] = deque(state['task_history'], maxlen=MAX_TASK_HISTORY)
 
     def _should_create_internal_task(self, user_message: str) -> bool:
         """Detect if a task requires multi-step internal tracking"""
-        multi_step_indicators = [
-            'create', 'build', 'develop', 'implement', 'design',
-            'analyze', 'review', 'process', 'generate', 'setup',
-            'configure', 'install', 'deploy', 'test', 'debug',
-            'multiple', 'several', 'various', 'different',
-            'step by step', 'phases', 'stages', 'milestones'
-        ]
-        
-        message_lower = user_message.lower()
-        return any(indicator in message_lower for indicator in multi_step_indicators)
+        return bool(_MULTISTEP_RE.search(user_message))
 
     def create_task(self, description: str, priority: str = "medium", context: Dict = None) -> str:
         """Create a new internal task"""
@@ -78,74 +121,115 @@ class InternalTaskTracker:
         if context:
             task.context = context
         
-        st.session_state[self.session_key]['tasks'][task_id] = task.to_dict()
-        st.session_state[self.session_key]['active_task_id'] = task_id
+        state = st.session_state[self.session_key]
+        state['tasks'][task_id] = task.to_dict()
+        state['active_task_id'] = task_id
         
         return task_id
 
+    def _subtask_index(self, task: Dict) -> Dict:
+        """Lookup tables for a task's subtasks, kept alongside the task dict.
+
+        by_id: subtask id -> subtask; by_desc: lowercased description -> first subtask id;
+        pending: ids in creation order, pruned lazily as subtasks leave 'pending'.
+        Rebuilt whenever it is missing or out of step with the subtask list.
+        """
+        subtasks = task['subtasks']
+        index = task.get('_subtask_index')
+        if index is None or index['count'] != len(subtasks):
+            by_desc = {}
+            for subtask in subtasks:
+                by_desc.setdefault(subtask['description'].lower(), subtask['id'])
+            index = task['_subtask_index'] = {
+                'count': len(subtasks),
+                'by_id': {subtask['id']: subtask for subtask in subtasks},
+                'by_desc': by_desc,
+                'pending': deque(subtask['id'] for subtask in subtasks if subtask['status'] == 'pending'),
+            }
+        return index
+
     def add_subtask(self, task_id: str, subtask_description: str) -> bool:
         """Add a subtask to an existing task"""
-        if task_id not in st.session_state[self.session_key]['tasks']:
+        task = st.session_state[self.session_key]['tasks'].get(task_id)
+        if task is None:
             return False
         
-        subtask = {
-            'id': str(uuid.uuid4())[:8],
-            'description': subtask_description,
-            'status': 'pending',
-            'created_at': datetime.now().isoformat()
-        }
-        
-        st.session_state[self.session_key]['tasks'][task_id]['subtasks'].append(subtask)
-        st.session_state[self.session_key]['tasks'][task_id]['updated_at'] = datetime.now().isoformat()
-        
+        self._append_subtasks(task, [subtask_description])
         return True
 
+    def _append_subtasks(self, task: Dict, descriptions: List[str]):
+        """Append pending subtasks to task, sharing one timestamp, and keep its index current"""
+        index = self._subtask_index(task)
+        now_iso = _now_iso()
+        for description in descriptions:
+            subtask = {
+                'id': str(uuid.uuid4())[:8],
+                'description': description,
+                'status': 'pending',
+                'created_at': now_iso
+            }
+            task['subtasks'].append(subtask)
+            index['count'] += 1
+            index['by_id'][subtask['id']] = subtask
+            index['by_desc'].setdefault(description.lower(), subtask['id'])
+            index['pending'].append(subtask['id'])
+        task['updated_at'] = now_iso
+
     def update_task_status(self, task_id: str, status: str) -> bool:
         """Update task status"""
-        if task_id not in st.session_state[self.session_key]['tasks']:
+        state = st.session_state[self.session_key]
+        task = state['tasks'].get(task_id)
+        if task is None:
             return False
         
-        st.session_state[self.session_key]['tasks'][task_id]['status'] = status
-        st.session_state[self.session_key]['tasks'][task_id]['updated_at'] = datetime.now().isoformat()
+        task['status'] = status
+        task['updated_at'] = _now_iso()
         
         if status == 'completed':
-            # Move to history
-            task_data = st.session_state[self.session_key]['tasks'][task_id]
-            st.session_state[self.session_key]['task_history'].append(task_data)
+            # Move to history (bounded deque drops the oldest entry)
+            state['task_history'].append(task)
             
             # Clear active task if this was it
-            if st.session_state[self.session_key]['active_task_id'] == task_id:
-                st.session_state[self.session_key]['active_task_id'] = None
+            if state['active_task_id'] == task_id:
+                state['active_task_id'] = None
         
         return True
 
     def update_subtask_status(self, task_id: str, subtask_id: str, status: str) -> bool:
         """Update subtask status"""
-        if task_id not in st.session_state[self.session_key]['tasks']:
+        task = st.session_state[self.session_key]['tasks'].get(task_id)
+        if task is None:
             return False
         
-        for subtask in st.session_state[self.session_key]['tasks'][task_id]['subtasks']:
-            if subtask['id'] == subtask_id:
-                subtask['status'] = status
-                subtask['updated_at'] = datetime.now().isoformat()
-                st.session_state[self.session_key]['tasks'][task_id]['updated_at'] = datetime.now().isoformat()
-                return True
+        index = self._subtask_index(task)
+        subtask = index['by_id'].get(subtask_id)
+        if subtask is None:
+            return False
         
-        return False
+        previous = subtask['status']
+        now_iso = _now_iso()
+        subtask['status'] = status
+        subtask['updated_at'] = now_iso
+        task['updated_at'] = now_iso
+        if status == 'pending' and previous != 'pending':
+            # Back to pending: it may already have been pruned from the queue, so rebuild it in order
+            index['pending'] = deque(s['id'] for s in task['subtasks'] if s['status'] == 'pending')
+        return True
 
     def get_active_task(self) -> Optional[Dict]:
         """Get the currently active task"""
-        active_id = st.session_state[self.session_key]['active_task_id']
-        if active_id and active_id in st.session_state[self.session_key]['tasks']:
-            return st.session_state[self.session_key]['tasks'][active_id]
+        state = st.session_state[self.session_key]
+        active_id = state['active_task_id']
+        if active_id:
+            return state['tasks'].get(active_id)
         return None
 
     def get_task_progress(self, task_id: str) -> Dict:
         """Get task progress summary"""
-        if task_id not in st.session_state[self.session_key]['tasks']:
+        task = st.session_state[self.session_key]['tasks'].get(task_id)
+        if task is None:
             return {}
         
-        task = st.session_state[self.session_key]['tasks'][task_id]
         subtasks = task.get('subtasks', [])
         
         if not subtasks:
@@ -171,7 +255,7 @@ class InternalTaskTracker:
             task_desc = user_message[:100] + "..." if len(user_message) > 100 else user_message
             
             # Determine priority based on keywords
-            priority = "high" if any(word in user_message.lower() for word in ['urgent', 'asap', 'critical', 'important']) else "medium"
+            priority = "high" if _URGENT_RE.search(user_message) else "medium"
             
             task_id = self.create_task(task_desc, priority, {'original_request': user_message})
             
@@ -184,33 +268,13 @@ class InternalTaskTracker:
 
     def _auto_generate_subtasks(self, task_id: str, user_message: str):
         """Auto-generate subtasks based on message content"""
-        message_lower = user_message.lower()
-        
-        # Common task patterns and their subtasks
-        if 'create' in message_lower or 'build' in message_lower:
-            self.add_subtask(task_id, "Analyze requirements")
-            self.add_subtask(task_id, "Design solution")
-            self.add_subtask(task_id, "Implement core functionality")
-            self.add_subtask(task_id, "Test and validate")
-            self.add_subtask(task_id, "Finalize and deliver")
-        
-        elif 'analyze' in message_lower or 'review' in message_lower:
-            self.add_subtask(task_id, "Gather and examine data")
-            self.add_subtask(task_id, "Identify key patterns")
-            self.add_subtask(task_id, "Generate insights")
-            self.add_subtask(task_id, "Provide recommendations")
-        
-        elif 'setup' in message_lower or 'configure' in message_lower:
-            self.add_subtask(task_id, "Check prerequisites")
-            self.add_subtask(task_id, "Install dependencies")
-            self.add_subtask(task_id, "Configure settings")
-            self.add_subtask(task_id, "Verify setup")
-        
-        elif 'debug' in message_lower or 'fix' in message_lower:
-            self.add_subtask(task_id, "Reproduce issue")
-            self.add_subtask(task_id, "Identify root cause")
-            self.add_subtask(task_id, "Implement solution")
-            self.add_subtask(task_id, "Test fix")
+        task = st.session_state[self.session_key]['tasks'].get(task_id)
+        if task is None:
+            return
+        for pattern, subtasks in _PATTERN_SUBTASKS:
+            if pattern.search(user_message):
+                self._append_subtasks(task, subtasks)
+                break
 
     def mark_subtask_completed(self, subtask_description_partial: str) -> bool:
         """Mark a subtask as completed based on partial description match"""
@@ -218,8 +282,16 @@ class InternalTaskTracker:
         if not active_task:
             return False
         
+        index = self._subtask_index(active_task)
+        partial = subtask_description_partial.lower()
+        
+        # An exact description names its subtask directly
+        subtask_id = index['by_desc'].get(partial)
+        if subtask_id and index['by_id'][subtask_id]['status'] != 'completed':
+            return self.update_subtask_status(active_task['id'], subtask_id, 'completed')
+        
         for subtask in active_task.get('subtasks', []):
-            if subtask_description_partial.lower() in subtask['description'].lower():
+            if partial in subtask['description'].lower():
                 if subtask['status'] != 'completed':
                     self.update_subtask_status(active_task['id'], subtask['id'], 'completed')
                     return True
@@ -232,17 +304,17 @@ class InternalTaskTracker:
         if not active_task:
             return None
         
-        for subtask in active_task.get('subtasks', []):
-            if subtask['status'] == 'pending':
-                return subtask
-        
-        return None
+        index = self._subtask_index(active_task)
+        pending = index['pending']
+        while pending and index['by_id'][pending[0]]['status'] != 'pending':
+            pending.popleft()
+        return index['by_id'][pending[0]] if pending else None
 
-    def cleanup_completed_tasks(self, max_history: int = 50):
-        """Clean up old completed tasks to prevent memory bloat"""
-        history = st.session_state[self.session_key]['task_history']
-        if len(history) > max_history:
-            st.session_state[self.session_key]['task_history'] = history[-max_history:]
+    def cleanup_completed_tasks(self, max_history: int = MAX_TASK_HISTORY):
+        """Change the history cap; the deque already drops old completed tasks on append"""
+        state = st.session_state[self.session_key]
+        if state['task_history'].maxlen != max_history:
+            state['task_history'] = deque(state['task_history'], maxlen=max_history)
 
 # Global instance for use throughout the application
 internal_tracker = InternalTaskTracker()
@@ -0,0 +1,50 @@
+"""Fast JSON read/write for the retrievers' on-disk index caches.
+
+Uses orjson when installed (bytes in/out, no separate utf-8 pass), else the stdlib.
+Large caches can be written zstandard-compressed; load_json detects compressed files
+by their frame magic, so readers don't need to know how a file was written.
+"""
+import json
+
+try:
+    import orjson  # type: ignore
+except Exception:  # orjson not installed
+    orjson = None
+
+try:
+    import zstandard  # type: ignore
+except Exception:  # zstandard not installed; compressed writes fall back to plain JSON
+    zstandard = None
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def dump_json(path, obj) -> None:
+    with open(path, 'wb') as f:
+        f.write(_dumps(obj))
+
+
+def dump_json_compressed(path, obj, level: int = 3) -> None:
+    data = _dumps(obj)
+    if zstandard is not None:
+        data = zstandard.ZstdCompressor(level=level).compress(data)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def load_json(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError(f"{path} is zstandard-compressed but zstandard is not installed")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
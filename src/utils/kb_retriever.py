@@ -1,28 +1,32 @@
-import json
 import os
 import re
 import hashlib
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
-import numpy as np
+from src.utils.embeddings import (
+    build_faiss_index, encode_query, encode_texts, load_embeddings, load_faiss_index,
+    save_embeddings, save_faiss_index, top_k_indices, warm_up_embedder,
+)
+from src.utils.json_cache import dump_json, dump_json_compressed, load_json
+
+try:
+    import xxhash  # type: ignore
+except Exception:  # xxhash not installed; fall back to blake2b
+    xxhash = None
 
 INDEX_DIR = Path("./workspace/cache/kb_index")
 INDEX_DIR.mkdir(parents=True, exist_ok=True)
 FAISS_PATH = INDEX_DIR / "kb_sections.faiss"
 IDS_PATH = INDEX_DIR / "kb_sections_ids.json"
-SECTIONS_PATH = INDEX_DIR / "kb_sections.json"
+SECTIONS_PATH = INDEX_DIR / "kb_sections.json.zst"  # zstd-compressed JSON
 SIG_PATH = INDEX_DIR / "kb_index.sig"
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
 TEXT_EXTS = {".md", ".markdown", ".txt"}
 
 
-def _load_embedder():
-    from sentence_transformers import SentenceTransformer
-    return SentenceTransformer(MODEL_NAME)
-
-
 def _try_import_faiss():
     try:
         import faiss  # type: ignore
@@ -31,79 +35,105 @@ def _try_import_faiss():
         return None
 
 
-def _discover_kb_files(extra_paths: List[str] | None = None) -> List[str]:
-    # Search the repo root and ./knowledge for md/txt, plus any explicit extra paths
-    root = Path('.')
-    knowledge_dir = Path('./knowledge')
-    files: List[str] = []
-    for base in [root, knowledge_dir]:
-        if not base.exists():
+# Directories never descended into while looking for KB files
+EXCLUDED_DIRS = frozenset({
+    '.git', 'node_modules', '.venv', 'venv', '__pycache__', 'workspace',
+    '.mypy_cache', '.pytest_cache', '.ruff_cache',
+})
+
+
+def _walk_text_files(base: str, files: Dict[str, os.stat_result]) -> None:
+    """Collect KB text files under base into files (path -> stat), pruning excluded dirs."""
+    try:
+        with os.scandir(base or '.') as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        path = os.path.join(base, entry.name) if base else entry.name
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in EXCLUDED_DIRS:
+                    _walk_text_files(path, files)
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in TEXT_EXTS:
+                files[path] = entry.stat()
+        except OSError:
             continue
-        for p in base.rglob('*'):
-            if p.is_file() and p.suffix.lower() in TEXT_EXTS:
-                # skip caches and heavy dirs
-                parts = set(p.parts)
-                if any(x in parts for x in ['.git', 'node_modules', '.venv', 'venv', '__pycache__', 'workspace', '.mypy_cache', '.pytest_cache', '.ruff_cache']):
-                    continue
-                files.append(str(p))
+
+
+def _discover_kb_files(extra_paths: List[str] | None = None) -> Dict[str, os.stat_result]:
+    """Find md/txt files under the repo root and ./knowledge, plus any explicit extra paths.
+
+    Returns {path: stat} sorted by path; the stats are reused for the index signature.
+    """
+    files: Dict[str, os.stat_result] = {}
+    for base in ['', 'knowledge']:
+        if base in EXCLUDED_DIRS:
+            continue
+        _walk_text_files(base, files)
     if extra_paths:
         for ep in extra_paths:
             try:
                 q = Path(ep)
-                if q.exists() and q.is_file() and q.suffix.lower() in TEXT_EXTS:
-                    files.append(str(q))
+                if q.is_file() and q.suffix.lower() in TEXT_EXTS:
+                    files[str(q)] = q.stat()
             except Exception:
                 pass
-    # De-duplicate
-    uniq = sorted(set(files))
-    return uniq
+    return dict(sorted(files.items()))
 
 
-def _make_signature(paths: List[str]) -> str:
-    stats = []
-    for p in sorted(paths):
-        try:
-            st = os.stat(p)
-            stats.append(f"{p}:{int(st.st_mtime)}:{st.st_size}")
-        except Exception:
-            stats.append(f"{p}:0:0")
-    raw = "|".join(stats).encode("utf-8")
-    return hashlib.sha256(raw).hexdigest()[:32]
+def _make_signature(files: Dict[str, os.stat_result]) -> str:
+    # Non-cryptographic cache key over the file listing, fed one file at a time
+    h = xxhash.xxh3_64() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    for p, st in sorted(files.items()):
+        h.update(f"{p}:{int(st.st_mtime)}:{st.st_size}|".encode("utf-8"))
+    return h.hexdigest()
 
 
-def _split_markdown_sections(text: str) -> List[dict]:
-    # If markdown-like, split by headings; otherwise, chunk by ~200 lines
-    lines = text.splitlines()
+# A heading line: 1-6 '#' then horizontal whitespace (never a newline) and the title
+_HEADING_RE = re.compile(r"^#{1,6}[^\S\n]+(.*)$", re.MULTILINE)
+# Line boundaries str.splitlines() honours besides '\n'
+_OTHER_LINE_BREAKS_RE = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+CHUNK_LINES = 200
+
+
+def _chunk_by_lines(text: str, chunk_lines: int = CHUNK_LINES) -> List[dict]:
     sections: List[dict] = []
-    current_title = ""
-    current_body: List[str] = []
-    found_heading = False
-
-    for line in lines:
-        if re.match(r"^#{1,6}\s+", line):
-            found_heading = True
-            if current_body:
-                sections.append({"title": current_title or "Untitled", "body": "\n".join(current_body).strip()})
-                current_body = []
-            current_title = re.sub(r"^#{1,6}\s+", "", line).strip()
-        else:
-            current_body.append(line)
-    if current_body:
-        sections.append({"title": current_title or "Untitled", "body": "\n".join(current_body).strip()})
-
-    if not found_heading:
+    pos = 0
+    while pos < len(text):
+        end = pos
+        for _ in range(chunk_lines):
+            nl = text.find("\n", end)
+            if nl == -1:
+                end = len(text)
+                break
+            end = nl + 1
+        sections.append({"title": f"Chunk {len(sections)+1}", "body": text[pos:end].strip()})
+        pos = end
+    return sections
+
+
+def _split_markdown_sections(text: str) -> List[dict]:
+    # If markdown-like, split by headings; otherwise, chunk by ~200 lines.
+    # Bodies are sliced straight out of text rather than rebuilt line by line.
+    if _OTHER_LINE_BREAKS_RE.search(text):
+        # Terminate every line so a trailing empty line still counts as one
+        text = "".join(line + "\n" for line in text.splitlines())
+    headings = list(_HEADING_RE.finditer(text))
+    if not headings:
         # Fallback chunking if no headings
-        chunk: List[str] = []
-        chunk_lines = 200
-        sections = []
-        for i, ln in enumerate(lines, start=1):
-            chunk.append(ln)
-            if len(chunk) >= chunk_lines:
-                sections.append({"title": f"Chunk {len(sections)+1}", "body": "\n".join(chunk).strip()})
-                chunk = []
-        if chunk:
-            sections.append({"title": f"Chunk {len(sections)+1}", "body": "\n".join(chunk).strip()})
+        return _chunk_by_lines(text)
 
+    sections: List[dict] = []
+    preamble = text[:headings[0].start()]
+    if preamble:
+        sections.append({"title": "Untitled", "body": preamble.strip()})
+    for i, m in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        # Drop the heading's own line break; a heading with no lines under it has no section
+        body = text[m.end() + 1:end]
+        if body:
+            sections.append({"title": m.group(1).strip() or "Untitled", "body": body.strip()})
     return sections
 
 
@@ -125,9 +155,8 @@ def build_kb_index(extra_paths: List[str] | None = None) -> int:
     signature = _make_signature(kb_files)
     try:
         if SIG_PATH.exists() and SIG_PATH.read_text() == signature and FAISS_PATH.exists() and IDS_PATH.exists() and SECTIONS_PATH.exists():
-            with open(SECTIONS_PATH, 'r', encoding='utf-8') as f:
-                ex = json.load(f)
-            return len(ex)
+            # One id per section; avoids decompressing the section bodies
+            return len(load_json(IDS_PATH))
     except Exception:
         pass
 
@@ -161,40 +190,51 @@ def build_kb_index(extra_paths: List[str] | None = None) -> int:
                 pass
         return 0
 
-    from sentence_transformers import SentenceTransformer
-    model = _load_embedder()
-    embs = model.encode(texts, batch_size=64, show_progress_bar=False, normalize_embeddings=True)
-    embs = np.asarray(embs, dtype=np.float32)
+    embs = encode_texts(texts, MODEL_NAME)
 
     faiss = _try_import_faiss()
     if faiss is not None:
-        index = faiss.IndexFlatIP(embs.shape[1])
-        index.add(embs)
-        faiss.write_index(index, str(FAISS_PATH))
+        index = build_faiss_index(faiss, embs)
+        save_faiss_index(faiss, index, FAISS_PATH)
     else:
-        np.save(str(FAISS_PATH).replace('.faiss', '.npy'), embs)
+        save_embeddings(str(FAISS_PATH).replace('.faiss', '.npy'), embs)
 
-    with open(IDS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(ids, f)
-    with open(SECTIONS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(all_sections, f)
+    dump_json(IDS_PATH, ids)
+    dump_json_compressed(SECTIONS_PATH, all_sections)
     SIG_PATH.write_text(signature, encoding='utf-8')
     return len(all_sections)
 
 
 def ensure_kb_index_built(extra_paths: List[str] | None = None) -> int:
+    warm_up_embedder()
     try:
         return build_kb_index(extra_paths)
     except Exception:
         return 0
 
 
+def _read_sections() -> Tuple[list, list, Dict[str, dict]]:
+    sections = load_json(SECTIONS_PATH)
+    return load_json(IDS_PATH), sections, {s['id']: s for s in sections}
+
+
+@lru_cache(maxsize=1)
+def _load_sections_cached(sig_mtime_ns: int) -> Tuple[list, list, Dict[str, dict]]:
+    return _read_sections()
+
+
+def _load_sections() -> Tuple[list, list, Dict[str, dict]]:
+    """Load (ids, sections, id -> section); reused across calls until the index signature is rewritten."""
+    try:
+        sig_mtime_ns = SIG_PATH.stat().st_mtime_ns
+    except OSError:
+        return _read_sections()
+    return _load_sections_cached(sig_mtime_ns)
+
+
 def retrieve_kb_sections(query: str, top_k: int = 3) -> List[Dict]:
     try:
-        with open(IDS_PATH, 'r', encoding='utf-8') as f:
-            ids = json.load(f)
-        with open(SECTIONS_PATH, 'r', encoding='utf-8') as f:
-            sections = json.load(f)
+        ids, sections, lookup = _load_sections()
     except Exception:
         return []
 
@@ -202,26 +242,20 @@ def retrieve_kb_sections(query: str, top_k: int = 3) -> List[Dict]:
         return []
 
     faiss = _try_import_faiss()
-    if faiss is not None and FAISS_PATH.exists():
-        index = faiss.read_index(str(FAISS_PATH))
-        model = _load_embedder()
-        q = model.encode([query], normalize_embeddings=True)
-        q = np.asarray(q, dtype=np.float32)
+    index = load_faiss_index(FAISS_PATH) if faiss is not None else None
+    if index is not None:
+        q = encode_query(query, MODEL_NAME)
         D, I = index.search(q, k=min(top_k * 3, len(ids)))
-        cand_ids = [ids[i] for i in I[0] if i < len(ids)]
+        cand_ids = [ids[i] for i in I[0] if 0 <= i < len(ids)]
     else:
-        npy_path = str(FAISS_PATH).replace('.faiss', '.npy')
-        if not os.path.exists(npy_path):
+        embs = load_embeddings(str(FAISS_PATH).replace('.faiss', '.npy'))
+        if embs is None:
             return []
-        embs = np.load(npy_path)
-        model = _load_embedder()
-        q = model.encode([query], normalize_embeddings=True)
-        q = np.asarray(q, dtype=np.float32)
+        q = encode_query(query, MODEL_NAME)
         sims = (embs @ q[0])
-        order = np.argsort(-sims)[: top_k * 3]
+        order = top_k_indices(sims, top_k * 3)
         cand_ids = [ids[i] for i in order]
 
-    lookup = {s['id']: s for s in sections}
     results: List[Dict] = []
     for cid in cand_ids:
         s = lookup.get(cid)
@@ -1,9 +1,12 @@
 import uuid
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 from pydriller import Repository
 
-from src.data.database import save_lesson
+from src.data.database import save_lessons_bulk
+
+# Lessons are written in batches so each flush is one transaction
+SAVE_BATCH_SIZE = 500
 
 
 def _normalize_github_url(url: str) -> Tuple[str, Optional[str]]:
@@ -25,14 +28,9 @@ def _normalize_github_url(url: str) -> Tuple[str, Optional[str]]:
         return url, None
 
 
-def mine_repo(repo_url: str, branch: Optional[str] = None, max_commits: int = 200,
-              keywords: Optional[List[str]] = None):
-    """
-    Mine a repository for bug-fix style commits and store lessons.
-
-    - Filters by commit message keywords if provided (e.g., ["fix", "bug", "error", "ssr"]).
-    - Stores only simple single-file modifications with a text diff (before/after).
-    """
+def _iter_repo_lessons(repo_url: str, branch: Optional[str] = None, max_commits: int = 200,
+                       keywords: Optional[List[str]] = None) -> Iterator[dict]:
+    """Yield lesson dicts for bug-fix style commits in a repository (see mine_repo)."""
     # Normalize GitHub commits URLs to repo + branch (e.g., .../commits/main)
     norm_repo_url, norm_branch = _normalize_github_url(repo_url)
     branch = branch or norm_branch
@@ -47,10 +45,18 @@ def mine_repo(repo_url: str, branch: Optional[str] = None, max_commits: int = 20
             if not any(k in msg_lower for k in keywords):
                 continue
 
-        # Focus on small, single-file changes
-        if len(commit.modified_files) != 1:
+        # Focus on small, single-file changes. commit.files comes from git's numstat, which
+        # is much cheaper than the full diffs modified_files builds, so reject on it first.
+        try:
+            if commit.files != 1:
+                continue
+        except Exception:
+            pass
+        # modified_files recomputes the diff on every access; read it once
+        modified_files = commit.modified_files
+        if len(modified_files) != 1:
             continue
-        mf = commit.modified_files[0]
+        mf = modified_files[0]
 
         # Skip binary or very large changes
         if mf.added_lines is None or mf.deleted_lines is None:
@@ -71,13 +77,38 @@ def mine_repo(repo_url: str, branch: Optional[str] = None, max_commits: int = 20
             'after_code': after,
             'tags': ','.join(keywords or [])
         }
-        try:
-            save_lesson(lesson)
-            count += 1
-        except Exception:
-            # Ignore storage errors and continue
-            pass
+        yield lesson
+        count += 1
 
+
+def _flush_lessons(batch: List[dict]) -> int:
+    try:
+        return save_lessons_bulk(batch)
+    except Exception:
+        # Ignore storage errors and continue
+        return 0
+    finally:
+        batch.clear()
+
+
+def mine_repo(repo_url: str, branch: Optional[str] = None, max_commits: int = 200,
+              keywords: Optional[List[str]] = None):
+    """
+    Mine a repository for bug-fix style commits and store lessons.
+
+    - Filters by commit message keywords if provided (e.g., ["fix", "bug", "error", "ssr"]).
+    - Stores only simple single-file modifications with a text diff (before/after).
+    """
+    count = 0
+    batch: List[dict] = []
+    try:
+        for lesson in _iter_repo_lessons(repo_url, branch, max_commits, keywords):
+            batch.append(lesson)
+            if len(batch) >= SAVE_BATCH_SIZE:
+                count += _flush_lessons(batch)
+    finally:
+        if batch:
+            count += _flush_lessons(batch)
     return count
 
 
@@ -93,13 +124,22 @@ DEFAULT_DATASETS = [
 
 def mine_default_datasets(limit_per_repo: int = 100):
     total = 0
-    for repo in DEFAULT_DATASETS:
-        total += mine_repo(
-            repo,
-            max_commits=limit_per_repo,
-            keywords=[
-                "fix", "bug", "error", "ssr", "import", "hydration",
-                "proxy", "rewrite", "csp", "cors"
-            ],
-        )
+    batch: List[dict] = []
+    try:
+        for repo in DEFAULT_DATASETS:
+            for lesson in _iter_repo_lessons(
+                repo,
+                max_commits=limit_per_repo,
+                keywords=[
+                    "fix", "bug", "error", "ssr", "import", "hydration",
+                    "proxy", "rewrite", "csp", "cors"
+                ],
+            ):
+                batch.append(lesson)
+                if len(batch) >= SAVE_BATCH_SIZE:
+                    total += _flush_lessons(batch)
+    finally:
+        # Keep what was mined from earlier repos even if a later crawl fails
+        if batch:
+            total += _flush_lessons(batch)
     return total
@@ -1,23 +1,25 @@
 import os
-import json
+from functools import lru_cache
 from typing import List, Dict, Optional, Tuple
 
 import numpy as np
 
-from src.data.database import get_all_lessons
+from src.data.database import get_all_lessons, get_lessons_by_ids
+from src.utils.embeddings import (
+    build_faiss_index, encode_query, encode_texts, load_embeddings, load_faiss_index,
+    save_embeddings, save_faiss_index, top_k_indices, warm_up_embedder,
+)
+from src.utils.json_cache import dump_json, load_json
 
 
 INDEX_PATH = "lessons_index.faiss"
 IDS_PATH = "lessons_index_ids.json"
 EMB_PATH = "lessons_embeddings.npy"  # fallback
+META_PATH = "lessons_meta.npz"  # filterable columns, row-aligned with IDS_PATH
+META_FIELDS = ("file_path", "framework", "language", "change_type", "tags")
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
 
-def _load_embedder():
-    from sentence_transformers import SentenceTransformer
-    return SentenceTransformer(MODEL_NAME)
-
-
 def _try_import_faiss():
     try:
         import faiss  # type: ignore
@@ -39,58 +41,101 @@ def _lesson_text(lesson: Dict) -> str:
     return f"{msg}\nMETA: {meta_str}\nBEFORE:\n{before}\nAFTER:\n{after}"
 
 
+def _save_meta(lessons: List[Dict]) -> None:
+    """Persist the filterable lesson fields as one string array per field (same order as the ids)."""
+    columns = {k: np.array([l.get(k) or "" for l in lessons], dtype=str) for k in META_FIELDS}
+    tmp_path = META_PATH + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp_path, META_PATH)
+
+
 def build_index() -> Tuple[int, int]:
     """Build and persist a semantic index over lessons. Returns (num_lessons, dim)."""
     lessons = get_all_lessons(limit=5000)
     if not lessons:
         # Create empty artifacts
-        np.save(EMB_PATH, np.zeros((0, 384), dtype=np.float32))
-        with open(IDS_PATH, "w") as f:
-            json.dump([], f)
+        save_embeddings(EMB_PATH, np.zeros((0, 384), dtype=np.float32))
+        _save_meta([])
+        dump_json(IDS_PATH, [])
         return 0, 0
 
     texts = [_lesson_text(l) for l in lessons]
     ids = [l["id"] for l in lessons]
 
-    model = _load_embedder()
-    embs = model.encode(texts, batch_size=64, show_progress_bar=False, normalize_embeddings=True)
-    embs = np.asarray(embs, dtype=np.float32)
+    embs = encode_texts(texts, MODEL_NAME)
 
-    # Persist ids
-    with open(IDS_PATH, "w") as f:
-        json.dump(ids, f)
+    # Persist metadata columns, then ids (the ids file's stat keys the caches below)
+    _save_meta(lessons)
+    dump_json(IDS_PATH, ids)
 
     # Try FAISS, else save numpy for fallback
     faiss = _try_import_faiss()
     if faiss is not None and embs.size > 0:
         dim = embs.shape[1]
-        index = faiss.IndexFlatIP(dim)
-        index.add(embs)
-        faiss.write_index(index, INDEX_PATH)
+        index = build_faiss_index(faiss, embs)
+        save_faiss_index(faiss, index, INDEX_PATH)
         return len(ids), dim
     else:
-        np.save(EMB_PATH, embs)
+        save_embeddings(EMB_PATH, embs)
         return len(ids), embs.shape[1] if embs.size > 0 else 0
 
 
+def _ids_key() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(IDS_PATH)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+@lru_cache(maxsize=1)
+def _load_ids_cached(key: Tuple[int, int]) -> List[str]:
+    return load_json(IDS_PATH)
+
+
 def _load_ids() -> List[str]:
-    if not os.path.exists(IDS_PATH):
+    """Load the indexed lesson ids; reused until build_index rewrites the file."""
+    key = _ids_key()
+    if key is None:
         return []
-    with open(IDS_PATH, "r") as f:
-        return json.load(f)
+    return _load_ids_cached(key)
+
+
+@lru_cache(maxsize=1)
+def _load_meta_cached(key: Tuple[int, int]) -> Optional[Dict[str, np.ndarray]]:
+    try:
+        with np.load(META_PATH) as npz:
+            return {k: npz[k] for k in npz.files}
+    except Exception:
+        return None
+
+
+def _load_meta(num_ids: int) -> Optional[Dict[str, np.ndarray]]:
+    """Metadata columns for the current index, or None if missing or out of step with the ids."""
+    key = _ids_key()
+    if key is None:
+        return None
+    meta = _load_meta_cached(key)
+    if not meta or any(len(col) != num_ids for col in meta.values()):
+        return None
+    return meta
 
 
 def _load_index():
     faiss = _try_import_faiss()
-    if faiss is not None and os.path.exists(INDEX_PATH):
-        return faiss.read_index(INDEX_PATH), "faiss"
-    if os.path.exists(EMB_PATH):
-        embs = np.load(EMB_PATH)
+    if faiss is not None:
+        index = load_faiss_index(INDEX_PATH)
+        if index is not None:
+            return index, "faiss"
+    embs = load_embeddings(EMB_PATH)
+    if embs is not None:
         return embs, "numpy"
     return None, None
 
 
 def ensure_index_built():
+    warm_up_embedder()
     if os.path.exists(INDEX_PATH) and os.path.exists(IDS_PATH):
         return
     if os.path.exists(EMB_PATH) and os.path.exists(IDS_PATH):
@@ -106,23 +151,31 @@ def retrieve(query: str, top_k: int = 3, filters: Optional[Dict] = None) -> List
     if index is None or not ids:
         return []
 
-    # Simple metadata filtering by reloading lessons and masking after similarity search
-    lessons = {l["id"]: l for l in get_all_lessons(limit=5000)}
-
-    model = _load_embedder()
-    q = model.encode([query], normalize_embeddings=True)
-    q = np.asarray(q, dtype=np.float32)
+    q = encode_query(query, MODEL_NAME)
 
     if kind == "faiss":
-        import faiss  # type: ignore
         D, I = index.search(q, k=min(top_k * 5, len(ids)))
-        cand_ids = [ids[i] for i in I[0] if i < len(ids)]
+        cand_idx = I[0][(I[0] >= 0) & (I[0] < len(ids))]
     else:
         # Cosine sim via dot product since normalized
         embs = index  # numpy array
         sims = (embs @ q[0])
-        order = np.argsort(-sims)[: top_k * 5]
-        cand_ids = [ids[i] for i in order]
+        cand_idx = top_k_indices(sims, top_k * 5)
+
+    # Metadata filtering after similarity search: mask candidates on the saved columns
+    # when every filter is covered, otherwise check the fetched rows below
+    filters = {k: v for k, v in (filters or {}).items() if v}
+    meta = _load_meta(len(ids)) if filters else None
+    if meta is not None and all(k in meta and isinstance(v, str) for k, v in filters.items()):
+        mask = np.ones(len(cand_idx), dtype=bool)
+        for k, v in filters.items():
+            mask &= meta[k][cand_idx] == v
+        cand_idx = cand_idx[mask]
+        filters = {}
+    cand_ids = [ids[i] for i in cand_idx]
+
+    # Only the surviving candidates are read from the DB
+    lessons = {l["id"]: l for l in get_lessons_by_ids(cand_ids)}
 
     results: List[Dict] = []
     for _id in cand_ids:
@@ -0,0 +1,49 @@
+import fcntl
+import os
+import time
+
+from src.data.database import close_connection, set_meta
+
+
+def auto_update_lessons(lock_path: str, limit_per_repo: int = 60) -> bool:
+    """
+    Mine the default datasets and rebuild the lessons index.
+
+    Meant to run in a worker process (it is a top-level function so it can be pickled).
+    Only one updater runs at a time across all sessions/processes: if another one holds
+    the file lock at `lock_path`, this returns False without doing anything.
+    """
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        try:
+            # Recorded up front so a crawl that fails or finds nothing still backs off
+            # the next sessions for a day instead of being restarted by each of them
+            set_meta('lessons_last_attempt_at', time.time())
+        except Exception:
+            pass
+        try:
+            # Imported here so pydriller/sentence-transformers stay off the app's startup path
+            from src.utils.lessons_miner import mine_default_datasets
+            from src.utils.lessons_retriever import build_index
+
+            # Mine a modest number to keep startup light
+            mine_default_datasets(limit_per_repo=limit_per_repo)
+            num_lessons, _ = build_index()
+        except Exception:
+            # Never interrupt the app if background update fails
+            num_lessons = 0
+        if num_lessons:
+            try:
+                set_meta('lessons_last_updated_at', time.time())
+            except Exception:
+                pass
+        return True
+    finally:
+        close_connection()
+        # Closing the descriptor also releases the flock
+        os.close(fd)
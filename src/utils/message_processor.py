@@ -4,14 +4,72 @@ Handles message consistency, filtering, and response formatting
 """
 
 import re
+import threading
+from itertools import islice
 import streamlit as st
 from typing import Dict, Any, List
 
+try:
+    import re2  # type: ignore  # google-re2: linear-time DFA matching
+except Exception:  # google-re2 not installed; use the stdlib engine
+    re2 = None
+
+# Whitespace/spacing cleanups shared by the filters
+_WS_RE = re.compile(r'\s+')
+# One scan for the final spacing fixes: space before a capital following a letter,
+# space after sentence punctuation followed by a letter, and whitespace runs to one space.
+# The camel branch consumes both letters, as the old separate pass did ("aBC" -> "a BC");
+# the punctuation branch only looks ahead so a capital after it can still start a camel match.
+_SPACING_RE = re.compile(r'([a-zA-Z])([A-Z])|([.!?])(?=[a-zA-Z])|\s+')
+_SENTENCE_SPLIT_RE = re.compile(r'[.!?]+')
+
+
+def _normalize_spacing(text: str) -> str:
+    # Unmatched groups expand to '', so one template serves all three branches
+    return _SPACING_RE.sub(r'\1\3 \2', text)
+
+
+def _union(patterns: List[str], flags: str = ''):
+    """Compile patterns into one alternation so a single scan replaces all of them.
+
+    Flags are given inline (e.g. 'is'), which RE2 and re both understand. RE2 is used
+    when available: the phrase lists need no backtracking, and RE2 runs in linear time
+    on arbitrarily long model output. Falls back to re if RE2 rejects a pattern.
+    """
+    pattern = (f"(?{flags})" if flags else "") + "|".join(f"(?:{p})" for p in patterns)
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except Exception:
+            pass
+    return re.compile(pattern)
+
+
+def _literal_prefix(pattern: str) -> str:
+    """Lowercased literal text every match of pattern must start with ('' if none)."""
+    prefix = re.match(r"[^\\()\[\]{}.*+?|^$]*", pattern).group(0)
+    if pattern[len(prefix):len(prefix) + 1] in ('?', '*', '{'):
+        prefix = prefix[:-1]  # the last character is optional
+    return prefix.lower()
+
+
+class _ResponseSettings(threading.local):
+    # Per-thread snapshot: the processor is shared by every session, and each
+    # session's script run streams on its own thread. None means "not snapshotted".
+    show_exec = None
+    concise = None
+
 
 class MessageProcessor:
     """Processes and filters messages for consistent user experience"""
+
+    # Chunk types hidden unless the user enabled code/terminal output
+    _HIDDEN_TYPES = frozenset({'code', 'console', 'confirmation'})
+    # Whole-prompt greetings (lowercased, trailing .!? removed)
+    _GREETINGS = frozenset({'hi', 'hey', 'hello', 'yo', 'sup', 'howdy', 'hola', 'hi there', 'hello there'})
     
     def __init__(self):
+        self._response = _ResponseSettings()
         self.verbose_patterns = [
             r"I see you(?:'re| are) (?:asking|trying|looking|wanting)",
             r"It looks like you(?:'re| are) (?:asking|trying|looking|wanting)",
@@ -55,32 +113,74 @@ class MessageProcessor:
             r"Console output:",
             r"Terminal output:",
         ]
+        
+        # Verbose and thought phrases get the same replacement, so they share one pattern
+        self._verbose_re = _union(self.verbose_patterns + self.thought_patterns, 'i')
+        # Cheap reject for the stdlib engine, which is slow on a big case-insensitive
+        # alternation: no phrase can match unless the text contains one of its literal
+        # openings. Not needed (and slower) when RE2 runs the scan.
+        self._verbose_prefixes = None
+        if isinstance(self._verbose_re, re.Pattern):
+            prefixes = [_literal_prefix(p) for p in self.verbose_patterns + self.thought_patterns]
+            if all(prefixes):
+                self._verbose_prefixes = tuple(prefixes)
+        self._meta_re = _union(self.meta_patterns, 'is')
+
+        # Lowercase phrases marking a looping response, and the subset to truncate at
+        self.repetitive_indicators = [
+            'plan recap',
+            'i will now check',
+            'let\'s proceed with verifying',
+            'the previous attempt',
+            'we need to verify',
+            'i believe you',
+        ]
+        self.truncate_indicators = ['plan recap', 'i will now check', 'let\'s proceed']
+        self._repetitive_re = _union([re.escape(p) for p in self.repetitive_indicators])
+        self._truncate_re = _union([re.escape(p) for p in self.truncate_indicators])
+
+    def begin_response(self):
+        """Snapshot the display settings once for the response about to be streamed"""
+        self._response.show_exec = bool(st.session_state.get('show_exec_output', False))
+        self._response.concise = bool(st.session_state.get('concise_mode', True))
+
+    def end_response(self):
+        """Drop the snapshot so later calls read the live session settings again"""
+        self._response.show_exec = None
+        self._response.concise = None
 
     def should_show_code_output(self) -> bool:
         """Check if code/terminal output should be shown"""
-        return st.session_state.get('show_exec_output', False)
+        show_exec = self._response.show_exec
+        if show_exec is None:
+            return st.session_state.get('show_exec_output', False)
+        return show_exec
 
     def is_concise_mode(self) -> bool:
         """Check if concise mode is enabled"""
-        return st.session_state.get('concise_mode', True)
+        concise = self._response.concise
+        if concise is None:
+            return st.session_state.get('concise_mode', True)
+        return concise
 
     def filter_verbose_language(self, text: str) -> str:
         """Remove verbose language patterns from text while preserving word spacing"""
         if not self.is_concise_mode():
             return text
             
-        # Remove verbose patterns but preserve spacing
-        for pattern in self.verbose_patterns:
-            text = re.sub(pattern, ' ', text, flags=re.IGNORECASE)
+        # Remove verbose and thought process patterns but preserve spacing. The prefix
+        # check lowercases like IGNORECASE only for ASCII, so other text always scans.
+        prefixes = self._verbose_prefixes
+        if prefixes is not None and text.isascii():
+            lowered = text.lower()
+            if any(p in lowered for p in prefixes):
+                text = self._verbose_re.sub(' ', text)
+        else:
+            text = self._verbose_re.sub(' ', text)
         
-        # Remove thought process patterns but preserve spacing
-        for pattern in self.thought_patterns:
-            text = re.sub(pattern, ' ', text, flags=re.IGNORECASE)
-        
-        # Clean up multiple spaces and normalize whitespace
-        text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with single space
-        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)  # Clean up excessive newlines
-        text = re.sub(r'^\s+', '', text, flags=re.MULTILINE)  # Remove leading whitespace
+        # Clean up multiple spaces and normalize whitespace (this also removes every
+        # newline, so no separate blank-line or leading-whitespace pass is needed)
+        text = _WS_RE.sub(' ', text)
         
         return text.strip()
 
@@ -90,22 +190,18 @@ class MessageProcessor:
             return text
         
         # Remove code blocks and execution output but preserve spacing
-        for pattern in self.meta_patterns:
-            text = re.sub(pattern, ' ', text, flags=re.DOTALL | re.IGNORECASE)
+        text = self._meta_re.sub(' ', text)
         
         # Normalize whitespace after filtering
-        text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with single space
+        text = _WS_RE.sub(' ', text)  # Replace multiple spaces with single space
         
         return text.strip()
 
     def process_chunk(self, chunk: Dict[str, Any]) -> Dict[str, Any]:
         """Process individual response chunks - NO FILTERING to preserve word spacing"""
-        chunk_type = chunk.get('type', '')
-        
         # Hide code execution chunks if not requested
-        if not self.should_show_code_output():
-            if chunk_type in ['code', 'console', 'confirmation']:
-                return {'type': 'hidden', 'content': ''}
+        if chunk.get('type', '') in self._HIDDEN_TYPES and not self.should_show_code_output():
+            return {'type': 'hidden', 'content': ''}
         
         # DO NOT filter message content here - it breaks word spacing
         # Filtering will be applied to the final complete response
@@ -116,25 +212,23 @@ class MessageProcessor:
         if not response:
             return False
             
-        # Check for repetitive patterns
-        lines = response.split('\n')
-        repetitive_indicators = [
-            'plan recap',
-            'i will now check',
-            'let\'s proceed with verifying',
-            'the previous attempt',
-            'we need to verify',
-            'i believe you'
-        ]
-        
+        # Count lines containing any indicator: one scan over the whole response.
+        # Indicators never span a newline, so each match lies within a single line.
+        text = response.lower()
         repetitive_count = 0
-        for line in lines:
-            line_lower = line.lower().strip()
-            if any(indicator in line_lower for indicator in repetitive_indicators):
-                repetitive_count += 1
-        
-        # If more than 2 repetitive lines, likely a loop
-        return repetitive_count > 2
+        line_end = -1
+        for match in self._repetitive_re.finditer(text):
+            start = match.start()
+            if start <= line_end:
+                continue  # another indicator on a line already counted
+            repetitive_count += 1
+            # If more than 2 repetitive lines, likely a loop
+            if repetitive_count > 2:
+                return True
+            line_end = text.find('\n', start)
+            if line_end == -1:
+                break
+        return False
 
     def format_final_response(self, response: str) -> str:
         """Format the final response for consistency with guaranteed proper word spacing"""
@@ -143,18 +237,14 @@ class MessageProcessor:
         
         # Check for repetitive loops and truncate if detected
         if self.detect_repetitive_response(response):
-            # Find first occurrence of repetitive pattern and cut there
-            lines = response.split('\n')
-            truncated_lines = []
-            
-            for line in lines:
-                line_lower = line.lower().strip()
-                # Stop at first repetitive pattern
-                if any(pattern in line_lower for pattern in ['plan recap', 'i will now check', 'let\'s proceed']):
-                    break
-                truncated_lines.append(line)
-            
-            response = '\n'.join(truncated_lines).strip()
+            # Find first occurrence of repetitive pattern and cut at the start of its line.
+            # lower() never adds or removes newlines, so line numbers carry over.
+            text = response.lower()
+            match = self._truncate_re.search(text)
+            if match:
+                line_no = text.count('\n', 0, match.start())
+                response = '\n'.join(response.split('\n', line_no)[:line_no])
+            response = response.strip()
             if response and not response.endswith(('.', '!', '?')):
                 response += '.'
         
@@ -164,22 +254,22 @@ class MessageProcessor:
         
         # CRITICAL: Ensure proper word spacing throughout
         # Fix common spacing issues that might occur during processing
-        response = re.sub(r'([a-zA-Z])([A-Z])', r'\1 \2', response)  # Add space before capital letters
-        response = re.sub(r'([.!?])([a-zA-Z])', r'\1 \2', response)  # Add space after punctuation
-        response = re.sub(r'([a-zA-Z])([.!?])', r'\1\2', response)  # No space before punctuation
-        response = re.sub(r'\s+', ' ', response)  # Normalize all whitespace to single spaces
+        response = _normalize_spacing(response)
         
         # Ensure concise responses
         if self.is_concise_mode():
-            # Split into sentences and limit if too verbose
-            sentences = re.split(r'[.!?]+', response)
-            if len(sentences) > 4:
+            # Limit if too verbose: more than 4 sentences means at least 4 punctuation
+            # runs, so stop scanning at the fourth instead of splitting the whole response
+            ends = list(islice(_SENTENCE_SPLIT_RE.finditer(response), 4))
+            if len(ends) == 4:
                 # Keep first 3 sentences and add ellipsis if needed
-                response = '. '.join(sentences[:3]) + '.'
+                starts = [0] + [m.end() for m in ends[:2]]
+                response = '. '.join(response[start:m.start()] for start, m in zip(starts, ends)) + '.'
+                # Joining can leave double spaces after the periods
+                response = _WS_RE.sub(' ', response)
         
         # Final spacing cleanup
         response = response.strip()
-        response = re.sub(r'\s+', ' ', response)  # One more pass to ensure single spaces
         
         return response
 
@@ -189,11 +279,7 @@ class MessageProcessor:
             return False
         
         p_lower = prompt.strip().lower()
-        if len(p_lower) <= 12:
-            greeting_pattern = r"^(hi|hey|hello|yo|sup|howdy|hola|hi there|hello there)[.!?]*$"
-            return bool(re.match(greeting_pattern, p_lower))
-        
-        return False
+        return len(p_lower) <= 12 and p_lower.rstrip('.!?') in self._GREETINGS
 
     def get_greeting_response(self) -> str:
         """Get a simple greeting response"""
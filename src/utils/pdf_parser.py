@@ -1,10 +1,15 @@
 import os
 import hashlib
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Iterator, Optional, Tuple, List
 import time
 import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+
+def _llama_api_key() -> Optional[str]:
+    return os.environ.get("LLAMA_CLOUD_API_KEY") or os.environ.get("LLAMA_PARSE_API_KEY")
 
 
 def parse_pdf_text(path: str, max_chars: int = 200_000, *, result_type: str = "markdown", ocr: bool = True, want_tables_json: bool = False) -> Tuple[str, str]:
@@ -16,7 +21,7 @@ def parse_pdf_text(path: str, max_chars: int = 200_000, *, result_type: str = "m
     - want_tables_json: if True, try to request structured tables (best-effort; concatenated to markdown).
     """
     path = str(path)
-    api_key = os.environ.get("LLAMA_CLOUD_API_KEY") or os.environ.get("LLAMA_PARSE_API_KEY")
+    api_key = _llama_api_key()
 
     # Cache file path based on name + mtime
     p = Path(path)
@@ -80,25 +85,69 @@ def parse_pdf_text(path: str, max_chars: int = 200_000, *, result_type: str = "m
         except Exception:
             pass
 
-    # Fallback: pypdf basic text extraction
-    try:
-        import pypdf  # type: ignore
-        reader = pypdf.PdfReader(path)
-        chunks = []
-        for page in reader.pages:
-            try:
-                chunks.append(page.extract_text() or "")
-            except Exception:
-                continue
-        text = "\n".join(chunks)
+    # Fallback: local extraction, native engines first
+    for engine, pages in _LOCAL_EXTRACTORS:
+        try:
+            chunks = []
+            total = 0
+            for page_text in pages(path):
+                chunks.append(page_text)
+                total += len(page_text) + 1
+                if total >= max_chars:
+                    break  # the rest would be cut off anyway
+            text = "\n".join(chunks)
+        except Exception:
+            # engine not installed or cannot read this file; try the next one
+            continue
         out = text[:max_chars]
         try:
             cache_file.write_text(out, encoding="utf-8")
         except Exception:
             pass
-        return out, "pypdf"
-    except Exception:
-        return "", "none"
+        return out, engine
+    return "", "none"
+
+
+def _pages_pymupdf(path: str) -> Iterator[str]:
+    import pymupdf  # type: ignore
+    with pymupdf.open(path) as doc:
+        for page in doc:
+            yield page.get_text()
+
+
+def _pages_pdfium(path: str) -> Iterator[str]:
+    import pypdfium2 as pdfium  # type: ignore
+    pdf = pdfium.PdfDocument(path)
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            try:
+                # PDFium ends lines with CRLF
+                yield textpage.get_text_range().replace("\r\n", "\n")
+            finally:
+                textpage.close()
+                page.close()
+    finally:
+        pdf.close()
+
+
+def _pages_pypdf(path: str) -> Iterator[str]:
+    import pypdf  # type: ignore
+    reader = pypdf.PdfReader(path)
+    for page in reader.pages:
+        try:
+            yield page.extract_text() or ""
+        except Exception:
+            continue
+
+
+# (engine name, page-text generator), fastest first: MuPDF and PDFium extract in C,
+# pypdf is pure Python and always available as the last resort
+_LOCAL_EXTRACTORS = [
+    ("pymupdf", _pages_pymupdf),
+    ("pdfium", _pages_pdfium),
+    ("pypdf", _pages_pypdf),
+]
 
 
 def parse_pdfs_concurrently(paths: List[str], *, max_chars_per_doc: int = 200_000) -> List[Tuple[str, str, str]]:
@@ -106,12 +155,25 @@ def parse_pdfs_concurrently(paths: List[str], *, max_chars_per_doc: int = 200_00
     Returns a list of tuples: (path, text, engine).
     """
     results: List[Tuple[str, str, str]] = []
-    with ThreadPoolExecutor(max_workers=min(4, max(1, len(paths)))) as ex:
+    if _llama_api_key() or len(paths) < 2:
+        # LlamaParse is network-bound, so threads overlap the requests
+        executor = ThreadPoolExecutor(max_workers=min(4, max(1, len(paths))))
+    else:
+        # Local extraction is pure-Python and CPU-bound; threads would serialize on the GIL.
+        # "spawn" keeps the parent's Streamlit state and SQLite connections out of the workers.
+        executor = ProcessPoolExecutor(
+            max_workers=min(os.cpu_count() or 1, len(paths)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    with executor as ex:
         futures = {ex.submit(parse_pdf_text, p, max_chars_per_doc): p for p in paths}
         for fut in as_completed(futures):
             p = futures[fut]
             try:
                 text, engine = fut.result()
+            except BrokenExecutor:
+                # A worker died (or processes are unavailable); parse here instead
+                text, engine = parse_pdf_text(p, max_chars_per_doc)
             except Exception:
                 text, engine = "", "none"
             results.append((p, text, engine))
@@ -1,28 +1,28 @@
-import json
 import os
 import re
 import hashlib
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Tuple
 
 import numpy as np
 
-from src.utils.pdf_parser import parse_pdf_text
+from src.utils.embeddings import (
+    HNSW_MIN_VECTORS, build_faiss_index, build_hnsw_index, encode_query, encode_texts, load_embeddings, load_faiss_index,
+    save_embeddings, save_faiss_index, top_k_indices, warm_up_embedder,
+)
+from src.utils.json_cache import dump_json, dump_json_compressed, load_json
+from src.utils.pdf_parser import parse_pdfs_concurrently
 
 INDEX_DIR = Path("./workspace/cache/pdf_index")
 INDEX_DIR.mkdir(parents=True, exist_ok=True)
 FAISS_PATH = INDEX_DIR / "pdf_sections.faiss"
 IDS_PATH = INDEX_DIR / "pdf_sections_ids.json"
-SECTIONS_PATH = INDEX_DIR / "pdf_sections.json"
+SECTIONS_PATH = INDEX_DIR / "pdf_sections.json.zst"  # zstd-compressed JSON
 SIG_PATH = INDEX_DIR / "pdf_index.sig"
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 
 
-def _load_embedder():
-    from sentence_transformers import SentenceTransformer
-    return SentenceTransformer(MODEL_NAME)
-
-
 def _try_import_faiss():
     try:
         import faiss  # type: ignore
@@ -32,35 +32,46 @@ def _try_import_faiss():
 
 
 def _make_signature(paths: List[str]) -> str:
-    stats = []
+    # Fed one file at a time; same bytes (and digest) as hashing the '|'-joined listing
+    h = hashlib.sha256()
+    sep = b""
     for p in sorted(paths):
         try:
             st = os.stat(p)
-            stats.append(f"{p}:{int(st.st_mtime)}:{st.st_size}")
+            entry = f"{p}:{int(st.st_mtime)}:{st.st_size}"
         except Exception:
-            stats.append(f"{p}:0:0")
-    raw = "|".join(stats).encode("utf-8")
-    return hashlib.sha256(raw).hexdigest()[:32]
+            entry = f"{p}:0:0"
+        h.update(sep + entry.encode("utf-8"))
+        sep = b"|"
+    return h.hexdigest()[:32]
+
+
+# A heading line: 1-6 '#' then horizontal whitespace (never a newline) and the title
+_HEADING_RE = re.compile(r"^#{1,6}[^\S\n]+(.*)$", re.MULTILINE)
+# Line boundaries str.splitlines() honours besides '\n'
+_OTHER_LINE_BREAKS_RE = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
 
 
 def _split_markdown_sections(md: str) -> List[Tuple[str, str]]:
     """Split markdown text into (title, body) sections using heading markers.
     Includes a 'Document' section if no headings found.
     """
-    lines = md.splitlines()
+    # Headings are found in one scan and bodies sliced out between them; a heading
+    # with no lines under it is dropped, as is an empty preamble
+    text = md
+    if _OTHER_LINE_BREAKS_RE.search(text):
+        # Terminate every line so a trailing empty line still counts as one
+        text = "".join(line + "\n" for line in text.splitlines())
     sections: List[Tuple[str, str]] = []
-    current_title = ""
-    current_body: List[str] = []
-    for line in lines:
-        if re.match(r"^#{1,6}\s+", line):
-            if current_body:
-                sections.append((current_title or "Untitled", "\n".join(current_body).strip()))
-                current_body = []
-            current_title = re.sub(r"^#{1,6}\s+", "", line).strip()
-        else:
-            current_body.append(line)
-    if current_body:
-        sections.append((current_title or "Untitled", "\n".join(current_body).strip()))
+    headings = list(_HEADING_RE.finditer(text))
+    preamble = text[:headings[0].start()] if headings else text
+    if preamble:
+        sections.append(("Untitled", preamble.strip()))
+    for i, m in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        body = text[m.end() + 1:end]
+        if body:
+            sections.append((m.group(1).strip() or "Untitled", body.strip()))
     if not sections:
         sections = [("Document", md)]
     return sections
@@ -83,18 +94,25 @@ def build_pdf_index(pdf_paths: List[str], *, max_chars_per_doc: int = 150_000) -
 
     signature = _make_signature(pdf_paths)
     try:
-        if SIG_PATH.exists() and SIG_PATH.read_text() == signature and FAISS_PATH.exists() and IDS_PATH.exists() and SECTIONS_PATH.exists():
+        # The signature file holds "<signature>\n<section count>\n", so an unchanged
+        # set of PDFs is answered without reading the index or any JSON
+        stored_sig, _, stored_count = SIG_PATH.read_text().partition("\n")
+        vectors_exist = FAISS_PATH.exists() or Path(str(FAISS_PATH).replace('.faiss', '.npy')).exists()
+        if stored_sig == signature and vectors_exist and IDS_PATH.exists() and SECTIONS_PATH.exists():
             # already current
-            with open(SECTIONS_PATH, 'r', encoding='utf-8') as f:
-                sections = json.load(f)
-            return len(sections)
+            stored_count = stored_count.strip()
+            if stored_count:
+                return int(stored_count)
+            # written before the count was recorded; one id per section
+            return len(load_json(IDS_PATH))
     except Exception:
         pass
 
-    # Parse PDFs and split into sections
+    # Parse PDFs (concurrently) and split into sections, in the caller's path order
+    texts_by_path = {p: text for p, text, engine in parse_pdfs_concurrently(pdf_paths, max_chars_per_doc=max_chars_per_doc)}
     all_sections: List[Dict] = []
     for p in pdf_paths:
-        text, engine = parse_pdf_text(p, max_chars=max_chars_per_doc, result_type="markdown", ocr=True)
+        text = texts_by_path.get(p)
         if not text:
             continue
         for i, (title, body) in enumerate(_split_markdown_sections(text)):
@@ -121,43 +139,59 @@ def build_pdf_index(pdf_paths: List[str], *, max_chars_per_doc: int = 150_000) -
                 pass
         return 0
 
-    model = _load_embedder()
-    embs = model.encode(texts, batch_size=64, show_progress_bar=False, normalize_embeddings=True)
-    embs = np.asarray(embs, dtype=np.float32)
+    embs = encode_texts(texts, MODEL_NAME)
 
     faiss = _try_import_faiss()
     if faiss is not None:
-        index = faiss.IndexFlatIP(embs.shape[1])
-        index.add(embs)
-        faiss.write_index(index, str(FAISS_PATH))
+        # Both index types store 8-bit codes: a quarter of the float32 size
+        if len(embs) > HNSW_MIN_VECTORS:
+            index = build_hnsw_index(faiss, embs)
+        else:
+            index = build_faiss_index(faiss, embs)
+        save_faiss_index(faiss, index, FAISS_PATH)
     else:
-        np.save(str(FAISS_PATH).replace('.faiss', '.npy'), embs)
+        save_embeddings(str(FAISS_PATH).replace('.faiss', '.npy'), embs, dtype=np.float16)
 
-    with open(IDS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(ids, f)
-    with open(SECTIONS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(all_sections, f)
-    SIG_PATH.write_text(signature, encoding='utf-8')
+    dump_json(IDS_PATH, ids)
+    dump_json_compressed(SECTIONS_PATH, all_sections)
+    SIG_PATH.write_text(f"{signature}\n{len(all_sections)}\n", encoding='utf-8')
     return len(all_sections)
 
 
 def ensure_pdf_index_built(pdf_paths: List[str]) -> int:
+    warm_up_embedder()
     try:
         return build_pdf_index(pdf_paths)
     except Exception:
         return 0
 
 
+def _read_sections() -> Tuple[list, list, Dict[str, dict]]:
+    sections = load_json(SECTIONS_PATH)
+    return load_json(IDS_PATH), sections, {s['id']: s for s in sections}
+
+
+@lru_cache(maxsize=1)
+def _load_sections_cached(sig_mtime_ns: int) -> Tuple[list, list, Dict[str, dict]]:
+    return _read_sections()
+
+
+def _load_sections() -> Tuple[list, list, Dict[str, dict]]:
+    """Load (ids, sections, id -> section); reused across calls until the index signature is rewritten."""
+    try:
+        sig_mtime_ns = SIG_PATH.stat().st_mtime_ns
+    except OSError:
+        return _read_sections()
+    return _load_sections_cached(sig_mtime_ns)
+
+
 def retrieve_pdf_sections(query: str, top_k: int = 3) -> List[Dict]:
     """Retrieve top-k relevant PDF sections for the query.
     Returns list of dicts with keys: id, path, title, body
     """
     # Load artifacts
     try:
-        with open(IDS_PATH, 'r', encoding='utf-8') as f:
-            ids = json.load(f)
-        with open(SECTIONS_PATH, 'r', encoding='utf-8') as f:
-            sections = json.load(f)
+        ids, sections, lookup = _load_sections()
     except Exception:
         return []
 
@@ -165,30 +199,23 @@ def retrieve_pdf_sections(query: str, top_k: int = 3) -> List[Dict]:
         return []
 
     faiss = _try_import_faiss()
-    if faiss is not None and FAISS_PATH.exists():
-        index = faiss.read_index(str(FAISS_PATH))
-        from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer(MODEL_NAME)
-        q = model.encode([query], normalize_embeddings=True)
-        q = np.asarray(q, dtype=np.float32)
+    index = load_faiss_index(FAISS_PATH) if faiss is not None else None
+    if index is not None:
+        q = encode_query(query, MODEL_NAME)
         D, I = index.search(q, k=min(top_k * 3, len(ids)))
-        cand_ids = [ids[i] for i in I[0] if i < len(ids)]
+        cand_ids = [ids[i] for i in I[0] if 0 <= i < len(ids)]
     else:
         # Fallback: load numpy array if present
-        npy_path = str(FAISS_PATH).replace('.faiss', '.npy')
-        if not os.path.exists(npy_path):
+        embs = load_embeddings(str(FAISS_PATH).replace('.faiss', '.npy'))
+        if embs is None:
             return []
-        embs = np.load(npy_path)
-        from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer(MODEL_NAME)
-        q = model.encode([query], normalize_embeddings=True)
-        q = np.asarray(q, dtype=np.float32)
-        sims = (embs @ q[0])
-        order = np.argsort(-sims)[: top_k * 3]
+        q = encode_query(query, MODEL_NAME)
+        # Stored as float16; score in float32
+        sims = embs.astype(np.float32) @ q[0]
+        order = top_k_indices(sims, top_k * 3)
         cand_ids = [ids[i] for i in order]
 
     # Map ids to section dicts
-    lookup = {s['id']: s for s in sections}
     results = []
     for cid in cand_ids:
         s = lookup.get(cid)
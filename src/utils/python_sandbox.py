@@ -1,80 +1,94 @@
-import sys
 import io
 import contextlib
-from types import ModuleType
-import builtins
+from types import MappingProxyType, ModuleType
+from functools import lru_cache
+
+
+@lru_cache(maxsize=128)
+def _compile(code: str):
+    # Retried and re-run snippets skip parsing and compiling; shared by every instance
+    return compile(code, '<string>', 'exec')
+
+
+# Safe built-in functions. Read-only and shared by every instance, so snippets
+# cannot rebind a builtin for later ones.
+_SAFE_BUILTINS = MappingProxyType({
+    'abs': abs,
+    'all': all,
+    'any': any,
+    'ascii': ascii,
+    'bin': bin,
+    'bool': bool,
+    'bytearray': bytearray,
+    'bytes': bytes,
+    'callable': callable,
+    'chr': chr,
+    'classmethod': classmethod,
+    'complex': complex,
+    'dict': dict,
+    'divmod': divmod,
+    'enumerate': enumerate,
+    'filter': filter,
+    'float': float,
+    'format': format,
+    'frozenset': frozenset,
+    'hash': hash,
+    'hex': hex,
+    'id': id,
+    'int': int,
+    'isinstance': isinstance,
+    'issubclass': issubclass,
+    'iter': iter,
+    'len': len,
+    'list': list,
+    'map': map,
+    'max': max,
+    'min': min,
+    'next': next,
+    'object': object,
+    'oct': oct,
+    'ord': ord,
+    'pow': pow,
+    'print': print,
+    'property': property,
+    'range': range,
+    'repr': repr,
+    'reversed': reversed,
+    'round': round,
+    'set': set,
+    'slice': slice,
+    'sorted': sorted,
+    'staticmethod': staticmethod,
+    'str': str,
+    'sum': sum,
+    'super': super,
+    'tuple': tuple,
+    'type': type,
+    'zip': zip,
+})
+
+# Restricted globals; each instance gets its own copy
+_RESTRICTED_GLOBALS_TEMPLATE = MappingProxyType({
+    '__builtins__': _SAFE_BUILTINS,
+    '__name__': '__main__',
+    '__doc__': None,
+    '__package__': None,
+    '__loader__': None,
+    '__spec__': None,
+    '__file__': '<string>',
+})
+
 
 class RestrictedEnvironment:
     """Basic Python sandbox using restricted execution environment"""
 
     def __init__(self):
-        # Safe built-in functions
-        self.safe_builtins = {
-            'abs': builtins.abs,
-            'all': builtins.all,
-            'any': builtins.any,
-            'ascii': builtins.ascii,
-            'bin': builtins.bin,
-            'bool': builtins.bool,
-            'bytearray': builtins.bytearray,
-            'bytes': builtins.bytes,
-            'callable': builtins.callable,
-            'chr': builtins.chr,
-            'classmethod': builtins.classmethod,
-            'complex': builtins.complex,
-            'dict': builtins.dict,
-            'divmod': builtins.divmod,
-            'enumerate': builtins.enumerate,
-            'filter': builtins.filter,
-            'float': builtins.float,
-            'format': builtins.format,
-            'frozenset': builtins.frozenset,
-            'hash': builtins.hash,
-            'hex': builtins.hex,
-            'id': builtins.id,
-            'int': builtins.int,
-            'isinstance': builtins.isinstance,
-            'issubclass': builtins.issubclass,
-            'iter': builtins.iter,
-            'len': builtins.len,
-            'list': builtins.list,
-            'map': builtins.map,
-            'max': builtins.max,
-            'min': builtins.min,
-            'next': builtins.next,
-            'object': builtins.object,
-            'oct': builtins.oct,
-            'ord': builtins.ord,
-            'pow': builtins.pow,
-            'print': builtins.print,
-            'property': builtins.property,
-            'range': builtins.range,
-            'repr': builtins.repr,
-            'reversed': builtins.reversed,
-            'round': builtins.round,
-            'set': builtins.set,
-            'slice': builtins.slice,
-            'sorted': builtins.sorted,
-            'staticmethod': builtins.staticmethod,
-            'str': builtins.str,
-            'sum': builtins.sum,
-            'super': builtins.super,
-            'tuple': builtins.tuple,
-            'type': builtins.type,
-            'zip': builtins.zip,
-        }
+        self.safe_builtins = _SAFE_BUILTINS
+        self.restricted_globals = dict(_RESTRICTED_GLOBALS_TEMPLATE)
+        self.restricted_globals['__annotations__'] = {}
 
-        # Restricted globals
-        self.restricted_globals = {
-            '__builtins__': self.safe_builtins,
-            '__name__': '__main__',
-            '__doc__': None,
-            '__package__': None,
-            '__loader__': None,
-            '__spec__': None,
-            '__annotations__': {},
-            '__file__': '<string>',
-        }
+        # Reused for every execute_code call's captured stdout
+        self._buf = io.StringIO()
 
     def execute_code(self, code: str, language: str = "python") -> str:
         """Execute code in restricted Python environment"""
@@ -82,18 +96,15 @@ class RestrictedEnvironment:
             return f"⚠️ Python sandbox only supports Python code. For {language}, use local execution."
 
         try:
-            # Capture stdout
-            old_stdout = sys.stdout
-            sys.stdout = captured_output = io.StringIO()
-
-            # Execute code in restricted environment
-            exec(code, self.restricted_globals)
+            # Capture stdout in the instance's buffer, emptied first
+            self._buf.seek(0)
+            self._buf.truncate()
+            with contextlib.redirect_stdout(self._buf):
+                # Execute code in restricted environment
+                exec(_compile(code), self.restricted_globals)
 
             # Get output
-            output = captured_output.getvalue()
-
-            # Restore stdout
-            sys.stdout = old_stdout
+            output = self._buf.getvalue()
 
             if output.strip():
                 return f"🐍 Python Sandbox:\n{output}"
@@ -101,6 +112,4 @@ class RestrictedEnvironment:
                 return "🐍 Python Sandbox: Code executed successfully (no output)"
 
         except Exception as e:
-            # Restore stdout in case of error
-            sys.stdout = old_stdout
             return f"🐍 Python Sandbox Error: {str(e)}"
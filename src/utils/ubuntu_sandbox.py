@@ -4,7 +4,11 @@ Provides secure code execution using Linux namespaces, chroot, and resource limi
 Fallback when Docker is not available
 """
 
+import atexit
+import itertools
 import os
+import re
+import select
 import sys
 import subprocess
 import tempfile
@@ -14,16 +18,227 @@ import time
 import pwd
 import grp
 import resource
+import threading
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Generator, Iterator, List, Tuple
 import uuid
 import json
 
 
+# Environment variables sandboxed code runs with
+_RESTRICTED_ENV = MappingProxyType({
+    'PATH': '/bin:/usr/bin',
+    'HOME': '/home/sandbox',
+    'USER': 'sandbox',
+    'SHELL': '/bin/sh',
+    'PYTHONPATH': '',
+    'PYTHONDONTWRITEBYTECODE': '1',
+    'PYTHONUNBUFFERED': '1',
+})
+
+_LDD_LIB_RE = re.compile(rb'=>\s*(\S+)')
+
+
+@lru_cache(maxsize=4)
+def _shared_libraries(ldd_path: str, binary_path: str) -> Tuple[str, ...]:
+    """Existing shared libraries ldd resolves for binary_path (ldd runs once per binary)"""
+    result = subprocess.run([ldd_path, binary_path], capture_output=True)
+    if result.returncode != 0:
+        return ()
+    libs = (m.group(1).decode(errors='surrogateescape') for m in _LDD_LIB_RE.finditer(result.stdout))
+    return tuple(lib for lib in libs if os.path.exists(lib))
+
+
+# Runs inside each worker: one JSON request per stdin line names a job directory holding
+# code.py, and the snippet runs in a fresh __main__ namespace. Its stdout comes back as
+# {"out": ...} lines while it runs, then one {"ok": ..., "stderr": ...} line ends the job.
+# The protocol pipes are moved off fds 0/1 so snippets cannot read or write them.
+_WORKER_LOOP = r'''
+import io, json, os, resource, sys, traceback
+requests = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+replies = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+null = os.open(os.devnull, os.O_RDWR)
+os.dup2(null, 0)
+os.dup2(null, 1)
+
+class Output(io.TextIOBase):
+    # Forwards stdout a line at a time (or every 64K characters without a newline)
+    def __init__(self):
+        self.pending = []
+        self.size = 0
+    def writable(self):
+        return True
+    def write(self, s):
+        if not isinstance(s, str):
+            raise TypeError(f"write() argument must be str, not {type(s).__name__}")
+        self.pending.append(s)
+        self.size += len(s)
+        if '\n' in s or self.size >= 65536:
+            self.flush()
+        return len(s)
+    def flush(self):
+        if self.pending:
+            text = ''.join(self.pending)
+            self.pending, self.size = [], 0
+            replies.write(json.dumps({'out': text}) + '\n')
+            replies.flush()
+
+for line in requests:
+    job = json.loads(line)
+    if job.get('cpu'):
+        # RLIMIT_CPU counts the worker's whole life; give each job its own budget
+        try:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            soft = int(usage.ru_utime + usage.ru_stime) + 1 + job['cpu']
+            if hard != resource.RLIM_INFINITY:
+                soft = min(soft, hard)
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        except Exception:
+            pass
+    path = os.path.join(job['cwd'], 'code.py')
+    out, err = Output(), io.StringIO()
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(), out, err
+    sys.path[0] = job['cwd']
+    ok = True
+    try:
+        os.chdir(job['cwd'])
+        with open(path, encoding='utf-8') as f:
+            code = compile(f.read(), path, 'exec')
+        exec(code, {'__name__': '__main__', '__file__': path, '__builtins__': __builtins__})
+    except SystemExit as e:
+        if e.code is not None and not isinstance(e.code, int):
+            print(e.code, file=err)
+            ok = False
+        else:
+            ok = not e.code
+    except BaseException as e:
+        ok = False
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+    sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+    out.flush()
+    replies.write(json.dumps({'ok': ok, 'stderr': err.getvalue()}) + '\n')
+    replies.flush()
+'''
+
+
+class _SandboxWorker:
+    """A warm sandboxed Python interpreter that runs one snippet per request"""
+
+    def __init__(self, cmd: List[str], env: Dict[str, str], root: str, home: str,
+                 sandbox: Optional[Tuple[str, str, bool]] = None, preexec_fn=None):
+        self.root = root  # host path of the worker's chroot ('' = runs on the host filesystem)
+        self.home = home  # directory, as the worker sees it, that job directories go in
+        self.sandbox = sandbox  # (job_dir, root, mounted) of a chrooted worker
+        self.jobs = 0
+        self._pending = b''  # reply bytes read past the last complete line
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=None if root else home,
+            env=env,
+            preexec_fn=preexec_fn,
+            start_new_session=True,  # so stop() can kill the worker and anything it spawned
+        )
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(self, job: Dict[str, Any], timeout: float) -> Iterator[Dict[str, Any]]:
+        """Send one job and yield its messages: {'out': text} as the snippet writes to
+        stdout, then the final {'ok', 'stderr'} reply. Ends early if the worker dies.
+
+        Raises subprocess.TimeoutExpired if the job has not finished within timeout seconds.
+        """
+        self.jobs += 1
+        try:
+            self.process.stdin.write(json.dumps(job).encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+        except (OSError, ValueError):
+            return
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._read_line(deadline, timeout)
+            if line is None:
+                return
+            message = json.loads(line)
+            yield message
+            if 'out' not in message:
+                return
+
+    def _read_line(self, deadline: float, timeout: float) -> Optional[bytes]:
+        # Raw reads rather than readline(): select() cannot see data a file object has
+        # already buffered
+        fd = self.process.stdout.fileno()
+        chunks = [self._pending]
+        while b'\n' not in chunks[-1]:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise subprocess.TimeoutExpired(self.process.args, timeout)
+            data = os.read(fd, 65536)
+            if not data:
+                self._pending = b''
+                return None
+            chunks.append(data)
+        line, _, self._pending = b''.join(chunks).partition(b'\n')
+        return line
+
+    def stop(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except Exception:
+                pass
+
+
 class UbuntuSandboxExecutor:
     """
     Secure code execution sandbox using Linux security features
     """
+
+    # Result of the availability probe. It depends only on the process (euid, installed
+    # tools, kernel), so it is shared by every executor instance; None = not probed yet.
+    _available: Optional[bool] = None
+
+    # Absolute paths of the host tools the sandbox runs, resolved once per process
+    # (None = not installed). Absolute paths also keep working under the restricted PATH.
+    _TOOLS = ('unshare', 'chroot', 'prlimit', 'python3', 'ldd', 'mount', 'umount', 'socat')
+    _tool_paths: Optional[Dict[str, Optional[str]]] = None
+
+    # Interpreters started ahead of time so a snippet does not wait for Python to start.
+    # Shared by every executor instance (one is built on each rerun) and so by every
+    # session; each worker runs a single snippet and is then retired, so modules, globals
+    # and files one snippet leaves behind are never seen by the next. A replacement is
+    # started in the background after every run.
+    WORKER_POOL_SIZE = 2
+    _idle_workers: List[_SandboxWorker] = []
+    _workers_lock = threading.Lock()
+    _workers_atexit_registered = False
+
+    # Streamlit runs each session's script on its own thread, so snippets from different
+    # sessions already run side by side. This caps how many workers (each up to max_memory)
+    # are busy at once; snippets often wait on I/O, so the cap is not tied to cores alone.
+    MAX_CONCURRENT_JOBS = max(4, os.cpu_count() or 1)
+    _run_slots = threading.BoundedSemaphore(MAX_CONCURRENT_JOBS)
+
+    # Sandbox directories are named <pid>_<n>; the pid keeps servers sharing sandbox_root apart
+    _sandbox_ids = itertools.count()
+
+    # Held while the template is built, so a run arriving during the prewarm waits for it
+    # instead of building a second copy
+    _template_lock = threading.Lock()
     
     def __init__(self):
         self.sandbox_root = "/tmp/oi_sandbox"
@@ -33,13 +248,46 @@ class UbuntuSandboxExecutor:
         self.max_file_size = 10 * 1024 * 1024  # 10MB
         self.sandbox_user = "nobody"
         self.sandbox_group = "nogroup"
+
+        # Binaries and libraries are copied once into a template; each job gets a
+        # writable layer on top of it
+        self._template_root = os.path.join(self.sandbox_root, "_template")
+        self._overlay_supported: Optional[bool] = None
         
         # Port forwarding capabilities
         self.forwarded_ports = {}
         self.port_forward_processes = {}
         
     def is_available(self) -> bool:
-        """Check if Ubuntu sandbox can be created"""
+        """Check if Ubuntu sandbox can be created (probed once per process)"""
+        available = UbuntuSandboxExecutor._available
+        if available is None:
+            available = UbuntuSandboxExecutor._available = self._probe_availability()
+            if available:
+                threading.Thread(target=self._prewarm, name="ubuntu-sandbox-prewarm", daemon=True).start()
+        return available
+
+    def _prewarm(self):
+        """Build the template and start one worker so the first snippet does not wait for them"""
+        try:
+            worker = self._start_worker(full=os.geteuid() == 0)
+        except Exception:
+            return  # the first execution will hit (and report) the same problem
+        self._release_worker(worker)
+
+    def _tool(self, name: str) -> Optional[str]:
+        """Absolute path of a host tool, or None if it is not installed"""
+        paths = UbuntuSandboxExecutor._tool_paths
+        if paths is None:
+            paths = UbuntuSandboxExecutor._tool_paths = {t: shutil.which(t) for t in self._TOOLS}
+        return paths.get(name)
+
+    def refresh_availability(self) -> bool:
+        """Forget the cached probe result and check again"""
+        UbuntuSandboxExecutor._available = None
+        return self.is_available()
+
+    def _probe_availability(self) -> bool:
         try:
             # Check if we have necessary permissions and tools
             if os.geteuid() != 0:
@@ -49,12 +297,12 @@ class UbuntuSandboxExecutor:
             # Check for required tools
             required_tools = ['unshare', 'chroot']
             for tool in required_tools:
-                if not shutil.which(tool):
+                if not self._tool(tool):
                     return False
             
             # Test basic namespace creation
             result = subprocess.run(
-                ['unshare', '--pid', '--fork', '--mount-proc', 'true'],
+                [self._tool('unshare'), '--pid', '--fork', '--mount-proc', 'true'],
                 capture_output=True,
                 timeout=5
             )
@@ -88,214 +336,357 @@ class UbuntuSandboxExecutor:
         except Exception:
             return False
     
-    def _create_sandbox_environment(self) -> str:
-        """Create isolated sandbox environment"""
-        sandbox_id = str(uuid.uuid4())[:8]
-        sandbox_path = os.path.join(self.sandbox_root, sandbox_id)
-        
-        # Create sandbox directory structure
-        os.makedirs(sandbox_path, exist_ok=True)
-        
-        # Create basic directory structure
+    def _ensure_template(self) -> str:
+        """Build the shared sandbox root (directories, binaries, libraries) once"""
+        if os.path.isdir(self._template_root):
+            return self._template_root
+        with UbuntuSandboxExecutor._template_lock:
+            if not os.path.isdir(self._template_root):
+                self._build_template()
+        return self._template_root
+
+    def _build_template(self):
+        # Populate a private staging directory, then publish it with an atomic rename so
+        # a concurrent builder never sees (or uses) a half-copied template
+        staging = os.path.join(self.sandbox_root, f"_template.{uuid.uuid4().hex[:8]}")
+        self._populate_sandbox_root(staging)
+        try:
+            os.rename(staging, self._template_root)
+        except OSError:
+            # Another process published its template first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _populate_sandbox_root(self, sandbox_path: str):
+        """Create the directory layout and copy binaries and libraries into sandbox_path"""
+        # Basic directory structure
         dirs_to_create = [
             'bin', 'usr/bin', 'lib', 'lib64', 'usr/lib', 'usr/lib64',
             'tmp', 'home/sandbox', 'proc', 'dev', 'sys'
         ]
         
-        for dir_name in dirs_to_create:
-            os.makedirs(os.path.join(sandbox_path, dir_name), exist_ok=True)
-        
-        # Copy essential binaries
+        # Essential binaries
         essential_bins = [
             '/bin/sh', '/bin/bash', '/usr/bin/python3', '/usr/bin/python3.11'
         ]
         
-        for bin_path in essential_bins:
-            if os.path.exists(bin_path):
-                dest_path = os.path.join(sandbox_path, bin_path.lstrip('/'))
-                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # Every file copied in, as (source, destination)
+        copies = [
+            (path, os.path.join(sandbox_path, path.lstrip('/')))
+            for path in essential_bins + list(self._essential_libraries())
+            if os.path.exists(path)
+        ]
+        
+        # Create only the deepest directories; makedirs creates their parents on the way
+        dirs = {os.path.join(sandbox_path, d) for d in dirs_to_create}
+        dirs.update(os.path.dirname(dest_path) for _, dest_path in copies)
+        parents = {os.path.dirname(d) for d in dirs}
+        while parents:
+            dirs -= parents
+            parents = {os.path.dirname(p) for p in parents if p != os.path.dirname(p)}
+        for dir_path in sorted(dirs):
+            os.makedirs(dir_path, exist_ok=True)
+        
+        # Hardlinks share the host's file data, so this only writes metadata. That is safe
+        # here because code never runs in this root directly: each job gets an overlay
+        # (writes are copied up) or a full copy of it.
+        for src_path, dest_path in copies:
+            try:
+                os.link(os.path.realpath(src_path), dest_path)  # copy2 also follows symlinks
+            except OSError:
                 try:
-                    shutil.copy2(bin_path, dest_path)
+                    shutil.copy2(src_path, dest_path)  # e.g. sandbox_root is on another filesystem
                 except Exception:
                     pass  # Skip if copy fails
-        
-        # Copy essential libraries (simplified approach)
-        self._copy_essential_libraries(sandbox_path)
-        
-        return sandbox_path
-    
-    def _copy_essential_libraries(self, sandbox_path: str):
-        """Copy essential libraries for Python execution"""
-        try:
-            # Get Python library dependencies
-            python_path = shutil.which('python3')
-            if python_path:
+
+    def _create_sandbox_environment(self) -> Tuple[str, str, bool]:
+        """Create an isolated sandbox root for one worker on top of the shared template.
+
+        Returns (job_dir, root, mounted): root is the chroot target inside job_dir, and
+        mounted says whether it is an overlay mount that must be unmounted first.
+        """
+        template = self._ensure_template()
+        while True:
+            # Skip names left behind by an earlier process that had the same pid
+            job_dir = os.path.join(self.sandbox_root, f"{os.getpid()}_{next(self._sandbox_ids)}")
+            if not os.path.exists(job_dir):
+                break
+        root = os.path.join(job_dir, 'root')
+        upper = os.path.join(job_dir, 'upper')
+        work = os.path.join(job_dir, 'work')
+        for path in (root, upper, work):
+            os.makedirs(path, exist_ok=True)
+
+        # Writes land in this job's upper layer; the template is never modified
+        if self._overlay_supported is None and not self._tool('mount'):
+            self._overlay_supported = False
+        if self._overlay_supported is not False:
+            try:
                 result = subprocess.run(
-                    ['ldd', python_path],
+                    [self._tool('mount'), '-t', 'overlay', 'overlay',
+                     '-o', f'lowerdir={template},upperdir={upper},workdir={work}', root],
                     capture_output=True,
-                    text=True
+                    timeout=10
                 )
-                
-                if result.returncode == 0:
-                    for line in result.stdout.split('\n'):
-                        if '=>' in line:
-                            parts = line.split('=>')
-                            if len(parts) > 1:
-                                lib_path = parts[1].strip().split()[0]
-                                if os.path.exists(lib_path):
-                                    dest_path = os.path.join(sandbox_path, lib_path.lstrip('/'))
-                                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                                    try:
-                                        shutil.copy2(lib_path, dest_path)
-                                    except Exception:
-                                        pass
+                self._overlay_supported = result.returncode == 0
+            except Exception:
+                self._overlay_supported = False
+            if self._overlay_supported:
+                return job_dir, root, True
+
+        # No overlayfs: copy the template. Hardlinks would be cheaper, but code running
+        # in the chroot could then modify the binaries the next job executes.
+        os.rmdir(root)
+        shutil.copytree(template, root, symlinks=True)
+        return job_dir, root, False
+
+    def _remove_sandbox_environment(self, job_dir: str, root: str, mounted: bool):
+        """Unmount (if needed) and delete one job's sandbox"""
+        if mounted:
+            try:
+                subprocess.run([self._tool('umount') or 'umount', '--lazy', root], capture_output=True, timeout=10)
+            except Exception:
+                pass
+        shutil.rmtree(job_dir, ignore_errors=True)
+    
+    def _essential_libraries(self) -> Tuple[str, ...]:
+        """Shared libraries python3 needs (simplified approach)"""
+        try:
+            python_path = self._tool('python3')
+            ldd_path = self._tool('ldd')
+            if python_path and ldd_path:
+                return _shared_libraries(ldd_path, python_path)
         except Exception:
             pass  # Continue without library copying if it fails
+        return ()
     
-    def _set_resource_limits(self):
+    def _resource_limits(self, cpu_hard_limit: Optional[int] = None) -> List[Tuple[int, str, int, int]]:
+        """(RLIMIT_*, prlimit option, soft, hard) for each limit sandboxed code runs under"""
+        return [
+            (resource.RLIMIT_AS, 'as', self.max_memory, self.max_memory),  # memory
+            # A worker raises its soft CPU limit per job, up to the hard limit
+            (resource.RLIMIT_CPU, 'cpu', self.max_cpu_time, cpu_hard_limit or self.max_cpu_time),
+            (resource.RLIMIT_FSIZE, 'fsize', self.max_file_size, self.max_file_size),
+            (resource.RLIMIT_NPROC, 'nproc', 10, 10),  # number of processes
+        ]
+
+    def _set_resource_limits(self, cpu_hard_limit: Optional[int] = None):
         """Set resource limits for the sandbox process"""
-        try:
-            # Set memory limit
-            resource.setrlimit(resource.RLIMIT_AS, (self.max_memory, self.max_memory))
-            
-            # Set CPU time limit
-            resource.setrlimit(resource.RLIMIT_CPU, (self.max_cpu_time, self.max_cpu_time))
-            
-            # Set file size limit
-            resource.setrlimit(resource.RLIMIT_FSIZE, (self.max_file_size, self.max_file_size))
-            
-            # Limit number of processes
-            resource.setrlimit(resource.RLIMIT_NPROC, (10, 10))
-            
-        except Exception:
-            pass  # Continue if resource limits can't be set
+        for limit, _, soft, hard in self._resource_limits(cpu_hard_limit):
+            try:
+                resource.setrlimit(limit, (soft, hard))
+            except Exception:
+                pass  # Continue with the other limits if one can't be set
     
     def _create_restricted_environment(self) -> Dict[str, str]:
         """Create restricted environment variables"""
-        return {
-            'PATH': '/bin:/usr/bin',
-            'HOME': '/home/sandbox',
-            'USER': 'sandbox',
-            'SHELL': '/bin/sh',
-            'PYTHONPATH': '',
-            'PYTHONDONTWRITEBYTECODE': '1',
-            'PYTHONUNBUFFERED': '1',
-        }
+        return dict(_RESTRICTED_ENV)
     
     def execute_code(self, code: str, language: str = "python") -> str:
         """Execute code in the Ubuntu sandbox"""
         if not self.is_available():
             return "Ubuntu sandbox not available"
         
-        # Create temporary file for code
-        with tempfile.NamedTemporaryFile(mode='w', suffix=f'.{language}', delete=False) as code_file:
-            code_file.write(code)
-            code_file_path = code_file.name
-        
-        try:
-            if os.geteuid() == 0:
-                # Root execution with full sandboxing
-                return self._execute_with_full_sandbox(code_file_path, language)
-            else:
-                # User-level execution with basic restrictions
-                return self._execute_with_user_sandbox(code_file_path, language)
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(code_file_path)
-            except Exception:
-                pass
+        if os.geteuid() == 0:
+            # Root execution with full sandboxing
+            return self._execute_with_full_sandbox(code, language)
+        else:
+            # User-level execution with basic restrictions
+            return self._execute_with_user_sandbox(code, language)
+    
+    def execute_code_stream(self, code: str, language: str = "python") -> Iterator[str]:
+        """Execute code in the Ubuntu sandbox, yielding stdout as it is produced.
+
+        Raises RuntimeError (on first iteration) if the sandbox is not available. A failed
+        run ends with a chunk holding "Error: ..." on a new line.
+        """
+        if not self.is_available():
+            raise RuntimeError("Ubuntu sandbox not available")
+        full = os.geteuid() == 0
+        if language != "python":
+            yield f"Language {language} not supported in {'Ubuntu' if full else 'user'} sandbox"
+            return
+        error = yield from self._run_job(code, full)
+        if error is not None:
+            yield f"\nError: {error}"
     
-    def _execute_with_full_sandbox(self, code_file_path: str, language: str) -> str:
+    def _execute_with_full_sandbox(self, code: str, language: str) -> str:
         """Execute with full root-level sandboxing"""
-        try:
-            # Create sandbox environment
-            sandbox_path = self._create_sandbox_environment()
-            
-            # Copy code file to sandbox
-            sandbox_code_path = os.path.join(sandbox_path, 'home/sandbox/code.py')
-            shutil.copy2(code_file_path, sandbox_code_path)
-            
-            # Prepare execution command
-            if language == "python":
-                cmd = ['python3', '/home/sandbox/code.py']
-            else:
-                return f"Language {language} not supported in Ubuntu sandbox"
-            
-            # Execute with namespace isolation
-            full_cmd = [
-                'unshare', '--pid', '--fork', '--mount-proc',
-                '--net', '--ipc', '--uts',
-                'chroot', sandbox_path
-            ] + cmd
-            
-            # Set up environment
-            env = self._create_restricted_environment()
-            
-            # Execute with timeout
-            result = subprocess.run(
-                full_cmd,
-                capture_output=True,
-                text=True,
-                timeout=self.max_execution_time,
-                env=env,
-                preexec_fn=self._set_resource_limits
-            )
-            
-            # Clean up sandbox
-            shutil.rmtree(sandbox_path, ignore_errors=True)
-            
-            if result.returncode == 0:
-                return result.stdout
-            else:
-                return f"Error: {result.stderr}"
-                
-        except subprocess.TimeoutExpired:
-            return "Error: Execution timeout"
-        except Exception as e:
-            return f"Error: {str(e)}"
+        if language != "python":
+            return f"Language {language} not supported in Ubuntu sandbox"
+        return self._run_in_worker(code, full=True)
     
-    def _execute_with_user_sandbox(self, code_file_path: str, language: str) -> str:
+    def _execute_with_user_sandbox(self, code: str, language: str) -> str:
         """Execute with user-level restrictions"""
+        if language != "python":
+            return f"Language {language} not supported in user sandbox"
+        return self._run_in_worker(code, full=False)
+
+    def _run_in_worker(self, code: str, full: bool) -> str:
+        """Run one snippet and return its stdout, or "Error: ..." if it failed"""
+        output = []
+        job = self._run_job(code, full)
+        while True:
+            try:
+                output.append(next(job))
+            except StopIteration as done:
+                error = done.value
+                break
+        if error is not None:
+            return f"Error: {error}"
+        return "".join(output)
+
+    def _run_job(self, code: str, full: bool) -> Generator[str, None, Optional[str]]:
+        """Run one snippet on a pooled worker in a fresh job directory.
+
+        Yields stdout as the snippet writes it and returns None on success, else the error
+        (stderr, timeout, ...). Waits for a free slot if MAX_CONCURRENT_JOBS are running.
+        """
+        if not self._run_slots.acquire(timeout=self.max_execution_time):
+            return "Sandbox busy"
+        worker = None
+        job_dir = None
         try:
-            # Create temporary working directory
-            with tempfile.TemporaryDirectory(prefix="oi_user_sandbox_") as temp_dir:
-                # Copy code file to temp directory
-                sandbox_code_path = os.path.join(temp_dir, f'code.{language}')
-                shutil.copy2(code_file_path, sandbox_code_path)
-                
-                # Prepare execution command
-                if language == "python":
-                    cmd = [sys.executable, sandbox_code_path]
-                else:
-                    return f"Language {language} not supported in user sandbox"
-                
-                # Create restricted environment
-                env = self._create_restricted_environment()
-                env.update(os.environ)  # Keep some system environment
-                
-                # Execute with restrictions
-                result = subprocess.run(
-                    cmd,
-                    cwd=temp_dir,
-                    capture_output=True,
-                    text=True,
-                    timeout=self.max_execution_time,
-                    env=env
-                )
-                
-                if result.returncode == 0:
-                    return result.stdout
+            worker = self._acquire_worker(full)
+
+            # Job directory as the worker sees it, and the same directory on the host
+            sandbox_dir = os.path.join(worker.home, f"job_{worker.jobs}")  # home is private to the worker
+            job_dir = os.path.join(worker.root, sandbox_dir.lstrip('/')) if worker.root else sandbox_dir
+            os.makedirs(job_dir)
+            with open(os.path.join(job_dir, 'code.py'), 'w', encoding='utf-8') as f:
+                f.write(code)
+
+            job: Dict[str, Any] = {'cwd': sandbox_dir}
+            if full:
+                job['cpu'] = self.max_cpu_time
+            for message in worker.run(job, self.max_execution_time):
+                if 'out' in message:
+                    yield message['out']
                 else:
-                    return f"Error: {result.stderr}"
-                    
+                    return None if message['ok'] else message['stderr']
+
+            # No final reply: killed mid-job, e.g. by the CPU time limit
+            worker.stop()
+            return f"Execution stopped (exit code {worker.process.returncode})"
         except subprocess.TimeoutExpired:
-            return "Error: Execution timeout"
+            return "Execution timeout"
         except Exception as e:
-            return f"Error: {str(e)}"
+            return str(e)
+        finally:
+            # Also reached if a streaming caller stops iterating mid-job
+            if job_dir is not None:
+                shutil.rmtree(job_dir, ignore_errors=True)
+            if worker is not None:
+                self._replace_worker(worker, full)
+            self._run_slots.release()
+
+    def _acquire_worker(self, full: bool) -> _SandboxWorker:
+        """Take an idle worker of the right kind from the pool, or start a new one"""
+        found = None
+        with UbuntuSandboxExecutor._workers_lock:
+            idle = UbuntuSandboxExecutor._idle_workers
+            dead = [w for w in idle if not w.alive()]
+            for worker in dead:
+                idle.remove(worker)
+            for i in range(len(idle) - 1, -1, -1):
+                if (idle[i].sandbox is not None) == full:
+                    found = idle.pop(i)
+                    break
+        for worker in dead:
+            self._retire_worker(worker)
+        return found or self._start_worker(full)
+
+    def _start_worker(self, full: bool) -> _SandboxWorker:
+        with UbuntuSandboxExecutor._workers_lock:
+            if not UbuntuSandboxExecutor._workers_atexit_registered:
+                atexit.register(self._shutdown_workers)
+                UbuntuSandboxExecutor._workers_atexit_registered = True
+
+        if full:
+            env = self._create_restricted_environment()
+            # Each worker gets its own root on top of the shared template
+            sandbox = self._create_sandbox_environment()
+            cmd = [
+                self._tool('unshare'), '--pid', '--fork', '--mount-proc',
+                '--net', '--ipc', '--uts',
+                self._tool('chroot'), sandbox[1],
+                'python3', '-u', '-c', _WORKER_LOOP
+            ]
+            # A worker runs one snippet, so its lifetime CPU limit is the snippet's budget
+            # plus a little for interpreter startup. The worker loop also sets the soft limit
+            # for the job itself, and max_execution_time bounds the job in wall-clock time.
+            cpu_hard_limit = self.max_cpu_time + 2
+            preexec_fn = None
+            if self._tool('prlimit'):
+                # Limits applied by prlimit rather than a preexec_fn, which would force
+                # subprocess onto a full fork() of this (large) process
+                cmd = [self._tool('prlimit')] + [
+                    f'--{option}={soft}:{hard}' for _, option, soft, hard in self._resource_limits(cpu_hard_limit)
+                ] + ['--'] + cmd
+            else:
+                preexec_fn = lambda: self._set_resource_limits(cpu_hard_limit)
+            try:
+                return _SandboxWorker(
+                    cmd, env, root=sandbox[1], home='/home/sandbox', sandbox=sandbox,
+                    preexec_fn=preexec_fn,
+                )
+            except Exception:
+                self._remove_sandbox_environment(*sandbox)
+                raise
+
+        home = tempfile.mkdtemp(prefix="oi_user_sandbox_")
+        env = {**_RESTRICTED_ENV, **os.environ}  # Keep some system environment
+        try:
+            return _SandboxWorker([sys.executable, '-u', '-c', _WORKER_LOOP], env, root='', home=home)
+        except Exception:
+            shutil.rmtree(home, ignore_errors=True)
+            raise
+
+    def _release_worker(self, worker: _SandboxWorker):
+        """Park an unused worker in the pool, or retire it if the pool is full"""
+        if worker.jobs == 0 and worker.alive():
+            with UbuntuSandboxExecutor._workers_lock:
+                if len(UbuntuSandboxExecutor._idle_workers) < self.WORKER_POOL_SIZE:
+                    UbuntuSandboxExecutor._idle_workers.append(worker)
+                    return
+        self._retire_worker(worker)
+
+    def _replace_worker(self, worker: _SandboxWorker, full: bool):
+        """Retire a used worker and start a spare in its place, off the caller's thread"""
+        threading.Thread(
+            target=self._retire_and_refill, args=(worker, full), name="ubuntu-sandbox-refill", daemon=True
+        ).start()
+
+    def _retire_and_refill(self, worker: _SandboxWorker, full: bool):
+        self._retire_worker(worker)
+        with UbuntuSandboxExecutor._workers_lock:
+            if len(UbuntuSandboxExecutor._idle_workers) >= self.WORKER_POOL_SIZE:
+                return
+        try:
+            spare = self._start_worker(full)
+        except Exception:
+            return  # the next run starts its own worker and reports the problem
+        self._release_worker(spare)
+
+    def _retire_worker(self, worker: _SandboxWorker):
+        """Kill a worker and remove its filesystem"""
+        worker.stop()
+        if worker.sandbox is not None:
+            self._remove_sandbox_environment(*worker.sandbox)
+        else:
+            shutil.rmtree(worker.home, ignore_errors=True)
+
+    def _shutdown_workers(self):
+        """Stop every idle worker in the pool"""
+        with UbuntuSandboxExecutor._workers_lock:
+            workers = UbuntuSandboxExecutor._idle_workers[:]
+            UbuntuSandboxExecutor._idle_workers.clear()
+        for worker in workers:
+            self._retire_worker(worker)
     
     def cleanup(self):
         """Clean up sandbox resources"""
+        self._shutdown_workers()
+
         # Stop all port forwarding
         for sandbox_port in list(self.port_forward_processes.keys()):
             self.stop_port_forwarding(sandbox_port)
@@ -349,9 +740,10 @@ class UbuntuSandboxExecutor:
             
             if host_port:
                 # Use socat for port forwarding if available
-                if shutil.which('socat'):
+                socat_path = self._tool('socat')
+                if socat_path:
                     cmd = [
-                        'socat', 
+                        socat_path, 
                         f'TCP-LISTEN:{host_port},fork,reuseaddr',
                         f'TCP:localhost:{sandbox_port}'
                     ]
@@ -3,6 +3,9 @@ Visual Development Monitor
 Captures and displays visual output from web development in sandboxes
 """
 
+import errno
+import re
+import selectors
 import subprocess
 import time
 import threading
@@ -15,6 +18,18 @@ import io
 from PIL import Image, ImageGrab
 import streamlit as st
 
+# Common patterns for web service startup, compiled once
+_SERVICE_PATTERNS = [
+    (re.compile(pattern, re.IGNORECASE), service_type)
+    for pattern, service_type in [
+        (r'Running on http://[^:]+:(\d+)', 'flask'),
+        (r'serving at http://[^:]+:(\d+)', 'http_server'),
+        (r'Local:\s+http://[^:]+:(\d+)', 'react'),
+        (r'localhost:(\d+)', 'generic'),
+        (r'port\s+(\d+)', 'generic')
+    ]
+]
+
 class VisualDevMonitor:
     def __init__(self):
         self.running_services = {}
@@ -39,10 +54,11 @@ class VisualDevMonitor:
         common_ports = [3000, 3001, 5000, 5001, 8000, 8080, 8501, 4200, 9000]
         
         while self.is_monitoring:
+            open_ports = self._probe_ports(common_ports)
             for port in common_ports:
-                if self._is_port_open(port) and port not in self.running_services:
+                if port in open_ports and port not in self.running_services:
                     self._detect_service_type(port)
-                elif not self._is_port_open(port) and port in self.running_services:
+                elif port not in open_ports and port in self.running_services:
                     # Service stopped
                     if port in self.running_services:
                         del self.running_services[port]
@@ -51,16 +67,50 @@ class VisualDevMonitor:
             
             time.sleep(2)  # Check every 2 seconds
     
+    def _probe_ports(self, ports, timeout=0.3):
+        """Return the set of ports accepting connections on localhost.
+
+        All connects are started non-blocking and waited on together, so a pass costs
+        at most one timeout however many ports are checked.
+        """
+        open_ports = set()
+        pending = {}
+        with selectors.DefaultSelector() as sel:
+            try:
+                for port in ports:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    err = sock.connect_ex(('127.0.0.1', port))
+                    if err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                        sel.register(sock, selectors.EVENT_WRITE, port)
+                        pending[sock] = port
+                        continue
+                    if err == 0:
+                        open_ports.add(port)
+                    sock.close()
+
+                deadline = time.monotonic() + timeout
+                while pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    for key, _ in sel.select(remaining):
+                        sock = key.fileobj
+                        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                            open_ports.add(key.data)
+                        sel.unregister(sock)
+                        del pending[sock]
+                        sock.close()
+            except OSError:
+                pass  # e.g. out of file descriptors; report what was found
+            finally:
+                for sock in pending:
+                    sock.close()
+        return open_ports
+    
     def _is_port_open(self, port):
         """Check if a port is open"""
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(1)
-            result = sock.connect_ex(('localhost', port))
-            sock.close()
-            return result == 0
-        except:
-            return False
+        return port in self._probe_ports([port])
     
     def _detect_service_type(self, port):
         """Detect what type of service is running on a port"""
@@ -104,21 +154,9 @@ class VisualDevMonitor:
     
     def _detect_web_services(self, output: str, sandbox_type: str):
         """Detect web services from output text"""
-        import re
-        
-        # Common patterns for web service startup
-        patterns = [
-            (r'Running on http://[^:]+:(\d+)', 'flask'),
-            (r'serving at http://[^:]+:(\d+)', 'http_server'),
-            (r'Local:\s+http://[^:]+:(\d+)', 'react'),
-            (r'localhost:(\d+)', 'generic'),
-            (r'port\s+(\d+)', 'generic')
-        ]
-        
-        for pattern, service_type in patterns:
-            matches = re.findall(pattern, output, re.IGNORECASE)
-            for match in matches:
-                port = int(match)
+        for pattern, service_type in _SERVICE_PATTERNS:
+            for match in pattern.finditer(output):
+                port = int(match.group(1))
                 if port not in self.running_services:
                     self.running_services[port] = {
                         'type': service_type,
@@ -1,5 +1,7 @@
+import multiprocessing
 import os
 import re
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
 from pathlib import Path
 from typing import Optional
 import streamlit as st
@@ -15,59 +17,257 @@ TEXT_EXTS = {
 def _is_text_file(path: Path) -> bool:
     if path.suffix.lower() in TEXT_EXTS:
         return True
-    # Fallback: small files without NULs
+    # Fallback: small files without NULs (raw fd read, no file object)
     try:
-        with open(path, 'rb') as f:
-            chunk = f.read(2048)
-            return b'\x00' not in chunk
-    except Exception:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
         return False
+    try:
+        return b'\x00' not in os.read(fd, 2048)
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
 
 
-def _iter_files(root: Path, include_glob: Optional[str] = None):
-    for dirpath, dirnames, filenames in os.walk(root):
-        base = os.path.basename(dirpath)
-        if base in SKIP_DIRS:
-            dirnames[:] = []
-            continue
-        for fn in filenames:
-            p = Path(dirpath) / fn
-            if include_glob and not p.match(include_glob):
-                # allow **/*.py style
+def _walk_files(dirpath: str):
+    """Paths of the files under dirpath, a directory's files before its subdirectories (like os.walk).
+
+    Uses the type information scandir already has, so entries are not stat'ed again.
+    Symlinked directories are not followed.
+    """
+    if os.path.basename(dirpath) in SKIP_DIRS:
+        return
+    subdirs = []
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
                 try:
-                    if not Path(str(p)).match(include_glob):
-                        continue
-                except Exception:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    yield entry.path
+                elif not entry.is_symlink():
+                    subdirs.append(entry.path)
+    except OSError:
+        return
+    for subdir in subdirs:
+        yield from _walk_files(subdir)
+
+
+def _iter_files(root: Path, include_glob: Optional[str] = None):
+    for path in _walk_files(os.fspath(root)):
+        p = Path(path)
+        if include_glob and not p.match(include_glob):
+            # allow **/*.py style
+            try:
+                if not Path(str(p)).match(include_glob):
                     continue
-            if _is_text_file(p):
-                yield p
+            except Exception:
+                continue
+        if _is_text_file(p):
+            yield p
+
+
+# Constructs whose meaning depends on the pattern seeing one line at a time (string anchors,
+# lookarounds, atomic groups); patterns using them are tested line by line
+_LINE_BOUND_TOKENS = ('\\A', '\\Z', '(?<', '(?!', '(?>', '*+', '++', '?+', '}+')
+
+
+# Characters after \x, \u and \U that give the code point
+_ESCAPE_PAYLOAD_LEN = {'x': 2, 'u': 4, 'U': 8}
+
+
+def _literal_prefilter(pattern: str, regex_mode: bool) -> Optional[str]:
+    """Longest literal that every match of pattern contains, or None when there is no useful one.
+
+    Only top-level literal runs count: text inside a group or class, or made optional by a
+    quantifier, can be missing from a match, and with alternation nothing is required.
+    """
+    if not regex_mode:
+        return pattern
+    if '|' in pattern:
+        return None
+    runs, run = [], []
+    depth, i, n = 0, 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c in '?*+{':
+            if run:
+                run.pop()  # the quantified character
+            if c == '{':
+                close = pattern.find('}', i)
+                i = n if close < 0 else close + 1
+        elif c == '\\' and i < n:
+            c = pattern[i]
+            i += 1
+            if depth == 0 and not (c.isascii() and c.isalnum()):
+                run.append(c)  # escaped punctuation is a literal character
+                continue
+            # Skip the payload of character-code escapes and backreferences; it is not literal text
+            if c in _ESCAPE_PAYLOAD_LEN:
+                i += _ESCAPE_PAYLOAD_LEN[c]
+            elif c == 'N':
+                close = pattern.find('}', i)
+                i = n if close < 0 else close + 1
+            elif c.isdigit():
+                # Octal escapes and group numbers run to at most three digits
+                for _ in range(2):
+                    if i < n and pattern[i].isdigit():
+                        i += 1
+        elif c == '[':
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < n and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            i += 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth = max(0, depth - 1)
+        elif c not in '.^$' and depth == 0:
+            run.append(c)
+            continue
+        elif depth:
+            continue
+        runs.append(run)
+        run = []
+    runs.append(run)
+    best = max((''.join(r) for r in runs), key=len)
+    if len(best) < 2 or '\n' in best:
+        return None
+    return best
+
+
+def _read_text(path: Path) -> str:
+    with open(path, 'rb') as f:
+        text = f.read().decode('utf-8', errors='ignore')
+    if '\r' in text:
+        # Same line breaks as text-mode iteration (universal newlines)
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
 
 
 def _search_file(path: Path, pattern: str, regex: bool, ignore_case: bool, max_matches: int = 50):
+    """Matching lines of path as (path, line number, line), at most max_matches of them.
+
+    The decoded file is searched as one string and only the lines holding a candidate
+    match are tested on their own, so results are the same as testing every line.
+    """
+    pat = pattern if regex else re.escape(pattern)
     flags = re.IGNORECASE if ignore_case else 0
-    if not regex:
-        # Escape pattern for literal search
-        pat = re.escape(pattern)
-    else:
-        pat = pattern
     try:
         rx = re.compile(pat, flags)
     except re.error as e:
         return [(path, -1, f"[regex error] {e}")]
+    line_matches = rx.search
+
+    literal = None
+    if not rx.flags & (re.IGNORECASE | re.VERBOSE):
+        literal = _literal_prefilter(pattern, regex)
+    if literal is not None:
+        # Only lines containing the literal can match; find them with a plain substring search
+        def next_candidate(pos):
+            return text.find(literal, pos)
+    elif any(tok in pat for tok in _LINE_BOUND_TOKENS):
+        def next_candidate(pos):
+            return pos
+    else:
+        scan = re.compile(pat, flags | re.MULTILINE).search
+
+        def next_candidate(pos):
+            m = scan(text, pos)
+            return m.start() if m else -1
 
-    results = []
     try:
-        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-            for i, line in enumerate(f, start=1):
-                if rx.search(line):
-                    results.append((path, i, line.rstrip('\n')))
-                    if len(results) >= max_matches:
-                        break
+        text = _read_text(path)
     except Exception as e:
-        results.append((path, -1, f"[read error] {e}"))
+        return [(path, -1, f"[read error] {e}")]
+
+    results = []
+    pos = line_start = 0
+    lineno = 1
+    while len(results) < max_matches and pos <= len(text):
+        idx = next_candidate(pos)
+        if idx < 0:
+            break
+        start = text.rfind('\n', 0, idx) + 1
+        if start == len(text):
+            break  # past the last line
+        lineno += text.count('\n', line_start, start)
+        line_start = start
+        end = text.find('\n', idx)
+        if end < 0:
+            end = len(text)
+        if line_matches(text[start:end + 1]):
+            results.append((path, lineno, text[start:end]))
+        pos = end + 1
     return results
 
 
+# Files per task handed to the search pool; big enough to amortize pickling the results
+SEARCH_CHUNK_SIZE = 32
+
+
+@st.cache_resource
+def _get_search_pool():
+    # Shared by all sessions; regex matching is CPU-bound and holds the GIL, so searches run
+    # in worker processes. "spawn" keeps Streamlit state out of the children.
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _search_files(paths, pattern: str, regex: bool, ignore_case: bool, max_matches: int):
+    """(path, hits) for each of paths with at least one match."""
+    found = []
+    for p in paths:
+        hits = _search_file(p, pattern, regex, ignore_case, max_matches=max_matches)
+        # Filter out files with no hits
+        hits = [h for h in hits if h and h[1] != 0 and not (h[1] == -1 and h[2].startswith('[regex error]'))]
+        if hits:
+            found.append((p, hits))
+    return found
+
+
+def _iter_matches(paths, pattern: str, regex: bool, ignore_case: bool, max_matches: int):
+    """(path, hits) for the matching files among paths, in the order of paths.
+
+    Chunks of files are searched in parallel in the search pool when there is more than one
+    core; whatever is still queued is cancelled once the caller stops iterating.
+    """
+    args = (pattern, regex, ignore_case, max_matches)
+    chunks = [paths[i:i + SEARCH_CHUNK_SIZE] for i in range(0, len(paths), SEARCH_CHUNK_SIZE)]
+    if (os.cpu_count() or 1) < 2 or len(chunks) < 2:
+        for chunk in chunks:
+            yield from _search_files(chunk, *args)
+        return
+    futures = []
+    try:
+        pool = _get_search_pool()
+        for chunk in chunks:
+            futures.append(pool.submit(_search_files, chunk, *args))
+    except (BrokenExecutor, RuntimeError):
+        # Pool died or cannot start processes; drop it so the next search gets a fresh one
+        _get_search_pool.clear()
+    try:
+        for i, chunk in enumerate(chunks):
+            found = None
+            if i < len(futures):
+                try:
+                    found = futures[i].result()
+                except BrokenExecutor:
+                    _get_search_pool.clear()
+            if found is None:
+                found = _search_files(chunk, *args)
+            yield from found
+    finally:
+        for fut in futures:
+            fut.cancel()
+
+
 def grep_panel():
     st.subheader("Code Search (grep)")
     st.caption("Search across this workspace. Supports regex, case options, and simple glob includes like **/*.py")
@@ -88,12 +288,8 @@ def grep_panel():
         root = DEFAULT_ROOT
         results_total = 0
         with st.spinner("Searching..."):
-            for p in _iter_files(root, include_glob or None):
-                hits = _search_file(p, q, regex, ignore_case, max_matches=max_hits)
-                # Filter out files with no hits
-                hits = [h for h in hits if h and h[1] != 0 and not (h[1] == -1 and h[2].startswith('[regex error]'))]
-                if not hits:
-                    continue
+            paths = list(_iter_files(root, include_glob or None))
+            for p, hits in _iter_matches(paths, q, regex, ignore_case, max_hits):
                 with st.expander(f"{p} ({len(hits)} matches)"):
                     for _, ln, content in hits:
                         st.code(f"{ln:>5}: {content}", language="text")
@@ -4,8 +4,28 @@ from src.utils.firejail_executor import FirejailCodeExecutor
 from src.utils.python_sandbox import RestrictedEnvironment
 from src.utils.ubuntu_sandbox import UbuntuSandboxExecutor
 from src.utils.deps import ensure_package
+import re
 import time
 
+# Openings that mark a command as Python code rather than a shell line
+_PY_HINT_RE = re.compile(r"^(from |import |def |class |print\(|for |while |if |try:|#)")
+# e.g., ModuleNotFoundError: No module named 'foo'
+_MISSING_MODULE_RE = re.compile(r"No module named ['\"]([a-zA-Z0-9_\-\.]+)['\"]")
+
+# Sandboxes in order of preference; the Python sandbox is always available
+_SANDBOX_LADDER = ('docker', 'firejail', 'ubuntu', 'python')
+# While a session runs below the top sandbox, re-check the better ones after this long,
+# doubling each time the re-check changes nothing
+EXECUTOR_BACKOFF_MIN = 30.0
+EXECUTOR_BACKOFF_MAX = 300.0
+
+
+@st.cache_resource
+def get_docker_executor() -> DockerCodeExecutor:
+    """Process-wide Docker executor, so image/daemon checks are shared across reruns and sessions."""
+    return DockerCodeExecutor()
+
+
 def setup_interpreter():
     try:
         st.session_state['interpreter'].reset()
@@ -31,7 +51,7 @@ def setup_interpreter():
     
     # Integrate sandboxing for code execution (Docker -> Firejail -> Ubuntu -> Python Sandbox -> Local)
     original_run = st.session_state['interpreter'].computer.run
-    docker_executor = DockerCodeExecutor()
+    docker_executor = get_docker_executor()
     firejail_executor = FirejailCodeExecutor()
     ubuntu_sandbox = UbuntuSandboxExecutor()
     python_sandbox = RestrictedEnvironment()
@@ -58,66 +78,94 @@ def setup_interpreter():
             'end': True,
         }
 
+    def _stream_console(first: str, rest):
+        # Forward output chunks to OI as they arrive; the last chunk carries end=True
+        yield {'type': 'console', 'format': 'output', 'content': first}
+        try:
+            for text in rest:
+                yield {'type': 'console', 'format': 'output', 'content': text}
+        except Exception as e:
+            yield {'type': 'console', 'format': 'output', 'content': f"\nExecution failed: {e}"}
+        yield {'type': 'console', 'format': 'output', 'content': '', 'end': True}
+
     def _is_probable_python_code(cmd: str) -> bool:
         c = (cmd or "").strip()
         # Exclude shell invocations like `python` or `python -V` etc.
         if c.lower() == 'python' or c.lower().startswith('python '):
             return False
         # Consider it code if it contains newlines or common Python syntax
-        if "\n" in c:
-            return True
-        import re as _re
-        return bool(_re.match(r"^(from |import |def |class |print\(|for |while |if |try:|#)", c))
+        return "\n" in c or _PY_HINT_RE.match(c) is not None
+
+    def _executor_available(name: str) -> bool:
+        if name == 'docker':
+            try:
+                available = docker_executor.is_available()
+            except Exception:
+                available = False
+            st.session_state['docker_available'] = available
+            st.session_state['docker_last_check'] = time.time()
+            return available
+        if name == 'firejail':
+            return firejail_executor.is_available()
+        if name == 'ubuntu':
+            return ubuntu_sandbox.is_available()
+        return True
+
+    def _choose_executor() -> str:
+        return next(name for name in _SANDBOX_LADDER if _executor_available(name))
+
+    def _active_executor() -> str:
+        """The session's sandbox, probed once and re-checked with backoff while below the top"""
+        active = st.session_state.get('active_executor')
+        now = time.time()
+        if active is None or (active != _SANDBOX_LADDER[0] and now >= st.session_state.get('executor_retry_at', 0)):
+            previous, active = active, _choose_executor()
+            backoff = st.session_state.get('executor_backoff', EXECUTOR_BACKOFF_MIN)
+            backoff = min(backoff * 2, EXECUTOR_BACKOFF_MAX) if active == previous else EXECUTOR_BACKOFF_MIN
+            st.session_state['executor_backoff'] = backoff
+            st.session_state['executor_retry_at'] = now + backoff
+            st.session_state['active_executor'] = active
+        return active
+
+    def _run_sandboxed(name: str, command: str):
+        """Start command on one sandbox; raises if that sandbox cannot run it"""
+        if name == 'docker':
+            stream = docker_executor.execute_code_stream(command, 'python')
+            # Pull the first chunk now so startup failures still fall through
+            first = next(stream, "")
+            return _stream_console("🐳 Docker Sandbox:\n" + first, stream)
+        if name == 'firejail':
+            result = firejail_executor.execute_code(command, 'python')
+            return _yield_console("🔥 Firejail Sandbox:\n" + (result or ""))
+        if name == 'ubuntu':
+            stream = ubuntu_sandbox.execute_code_stream(command, 'python')
+            first = next(stream, "")
+            return _stream_console("🐧 Ubuntu Sandbox:\n" + first, stream)
+        result = python_sandbox.execute_code(command, 'python')
+        return _yield_console("🐍 Python Sandbox:\n" + (result or ""))
 
     def sandboxed_run(command, *args, **kwargs):
         """Override run method to use sandbox (Docker > Firejail > Ubuntu > Python Sandbox > Local)"""
         try:
-            # For Python code, try Docker first
-            # Periodically retry Docker availability (every 5 minutes)
-            now = time.time()
-            if (now - st.session_state.get('docker_last_check', 0)) > 300:
-                try:
-                    st.session_state['docker_available'] = docker_executor.is_available()
-                except Exception:
-                    st.session_state['docker_available'] = False
-                st.session_state['docker_last_check'] = now
-
             if _is_probable_python_code(command):
-                try:
-                    # If user prefers local, skip all sandboxes
-                    if st.session_state.get('prefer_local_exec', False):
-                        raise RuntimeError('Prefer local execution')
-                    
-                    # Try Docker first
-                    result = docker_executor.execute_code(command, 'python') if st.session_state.get('docker_available', False) else 'Docker not available'
-                    # If docker is unavailable, fall through to other sandboxes
-                    if isinstance(result, str) and result.strip().lower().startswith('docker not available'):
-                        raise RuntimeError('Docker unavailable')
-                    return _yield_console("🐳 Docker Sandbox:\n" + (result or ""))
-                    
-                except Exception as docker_error:
-                    # Try Firejail if Docker fails/unavailable and not preferring local
-                    if not st.session_state.get('prefer_local_exec', False) and firejail_executor.is_available():
-                        try:
-                            result = firejail_executor.execute_code(command, 'python')
-                            return _yield_console("🔥 Firejail Sandbox:\n" + (result or ""))
-                        except Exception as firejail_error:
-                            pass
-                    
-                    # Try Ubuntu sandbox if Firejail fails
-                    if not st.session_state.get('prefer_local_exec', False) and ubuntu_sandbox.is_available():
-                        try:
-                            result = ubuntu_sandbox.execute_code(command, 'python')
-                            return _yield_console("🐧 Ubuntu Sandbox:\n" + (result or ""))
-                        except Exception as ubuntu_error:
-                            pass
-                    
-                    # Try Python sandbox as final fallback
+                # Run on the session's sandbox; if it fails, fall down the ladder and keep
+                # the first one that works for later commands. If user prefers local, skip
+                # the OS-level sandboxes but still use the restricted Python sandbox.
+                if st.session_state.get('prefer_local_exec', False):
+                    active = _SANDBOX_LADDER[-1]
+                else:
+                    active = _active_executor()
+                for name in _SANDBOX_LADDER[_SANDBOX_LADDER.index(active):]:
+                    if name != active and not _executor_available(name):
+                        continue
                     try:
-                        result = python_sandbox.execute_code(command, 'python')
-                        return _yield_console("🐍 Python Sandbox:\n" + (result or ""))
-                    except Exception as python_error:
-                        pass
+                        chunks = _run_sandboxed(name, command)
+                    except Exception:
+                        continue
+                    if name != active:
+                        st.session_state['active_executor'] = name
+                        st.session_state['executor_retry_at'] = time.time() + st.session_state.get('executor_backoff', EXECUTOR_BACKOFF_MIN)
+                    return chunks
             
             # For other commands or if sandboxes fail, use original method
             return original_run(command, *args, **kwargs)
@@ -128,9 +176,7 @@ def setup_interpreter():
             msg = str(e)
             missing = None
             # Simple parse for missing module
-            # e.g., ModuleNotFoundError: No module named 'foo'
-            import re
-            m = re.search(r"No module named ['\"]([a-zA-Z0-9_\-\.]+)['\"]", msg)
+            m = _MISSING_MODULE_RE.search(msg)
             if m:
                 missing = m.group(1)
             if missing and allow_install and allow_exec:
@@ -1,8 +1,6 @@
 import streamlit as st
-from st_components.st_interpreter import setup_interpreter
-from src.data.database import save_chat
+from st_components.st_interpreter import setup_interpreter, get_docker_executor
 from src.data.models import Chat
-from src.utils.message_processor import message_processor
 from src.utils.internal_task_tracker import internal_tracker
 # Database
 from src.data.database import save_chat, save_lesson
@@ -12,7 +10,6 @@ import uuid
 import re
 from src.utils.pdf_parser import parse_pdf_text
 from src.utils.pdf_retriever import ensure_pdf_index_built, retrieve_pdf_sections
-from src.utils.docker_executor import DockerCodeExecutor
 
 
 def chat_with_interpreter():
@@ -205,7 +202,7 @@ def handle_assistant_response(prompt):
         pl = (prompt or "").strip().lower()
         if any(kw in pl for kw in ["create a sandbox", "make a sandbox", "start sandbox", "docker sandbox", "check docker"]):
             # Probe Docker
-            docker = DockerCodeExecutor()
+            docker = get_docker_executor()
             available = False
             try:
                 available = docker.is_available()
@@ -275,16 +272,21 @@ def handle_assistant_response(prompt):
                 hidden = _build_hidden_lessons_context(prompt)
                 if hidden:
                     message = message + hidden
-        with st.spinner('thinking'):
-            for chunk in st.session_state['interpreter'].chat([{"role": "user", "type": "message", "content": message}], display=False, stream=True):
-                full_response = format_response(chunk, full_response)
-
-                # Join the formatted messages
-                message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
-
-        # Apply final message processing
-        final_response = message_processor.format_final_response(full_response)
+        # Read the display settings once, not once per streamed chunk
+        message_processor.begin_response()
+        try:
+            with st.spinner('thinking'):
+                for chunk in st.session_state['interpreter'].chat([{"role": "user", "type": "message", "content": message}], display=False, stream=True):
+                    full_response = format_response(chunk, full_response)
+
+                    # Join the formatted messages
+                    message_placeholder.markdown(full_response + "▌")
+                    message_placeholder.markdown(full_response)
+
+            # Apply final message processing
+            final_response = message_processor.format_final_response(full_response)
+        finally:
+            message_processor.end_response()
         
         st.session_state.messages.append(
             {"role": "assistant", "content": final_response})
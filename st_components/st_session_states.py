@@ -2,7 +2,6 @@ import streamlit as st
 import uuid
 import json
 import os
-from interpreter import interpreter
 
 from src.utils.prompts import PROMPTS
 
@@ -27,6 +26,8 @@ def init_session_states():
     if 'user_id' not in st.session_state:
         st.session_state['user_id'] = str(uuid.uuid4())
     if 'interpreter' not in st.session_state:
+        # Deferred: importing Open Interpreter pulls in litellm/openai and is slow
+        from interpreter import interpreter
         st.session_state['interpreter'] = interpreter
     
     # CRITICAL: Always ensure messages list exists for conversation persistence
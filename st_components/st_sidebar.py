@@ -8,7 +8,7 @@ from streamlit.components.v1 import html
 from streamlit_extras.add_vertical_space import add_vertical_space
 
 from st_components.st_conversations import conversation_navigation
-from src.utils.docker_executor import DockerCodeExecutor
+from st_components.st_interpreter import get_docker_executor
 from src.utils.firejail_executor import FirejailCodeExecutor
 from src.utils.ubuntu_sandbox import UbuntuSandboxExecutor
 from src.utils.python_sandbox import RestrictedEnvironment
@@ -28,7 +28,7 @@ def show_sandbox_status():
     st.subheader("🖥️ Sandbox Environment Status")
     
     # Initialize sandbox executors
-    docker_executor = DockerCodeExecutor()
+    docker_executor = get_docker_executor()
     firejail_executor = FirejailCodeExecutor()
     ubuntu_sandbox = UbuntuSandboxExecutor()
     python_sandbox = RestrictedEnvironment()
@@ -74,11 +74,15 @@ def show_sandbox_status():
     st.write("**Environment Controls:**")
     
     if st.button("🔄 Refresh Status"):
-        # Clear cache to force refresh
+        # Re-probe the process-wide availability caches, then clear the session's copies
+        docker_executor.refresh_availability()
+        ubuntu_sandbox.refresh_availability()
         if 'docker_available' in st.session_state:
             del st.session_state['docker_available']
         if 'docker_last_check' in st.session_state:
             del st.session_state['docker_last_check']
+        if 'active_executor' in st.session_state:
+            del st.session_state['active_executor']
         st.rerun()
     
     new_prefer_local = st.checkbox("Prefer Local Execution", value=prefer_local)